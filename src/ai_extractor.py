@@ -1,87 +1,309 @@
 import os
+import asyncio
+import time
+import hashlib
 import logging
+import threading
+import io
+import orjson
+import diskcache
+import pypdfium2 as pdfium
+from typing import List, Optional
+from pydantic import BaseModel
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 from dotenv import load_dotenv
 
+try:
+    import blake3
+except ImportError:  # optional: faster hashing for cache keys
+    blake3 = None
+
 # Load environment variables
 load_dotenv()
 
-def extract_with_gemini(file_path):
+# Content-addressed cache of Gemini results (persists across Streamlit reruns and restarts)
+CACHE_TTL = 30 * 86400
+# Opened on first use, so COCQ_CACHE_DIR can still be changed after import (e.g. by tests)
+_cache = None
+_cache_lock = threading.Lock()
+
+def _get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = diskcache.Cache(os.path.expanduser(os.getenv("COCQ_CACHE_DIR", "~/.cocq_cache")))
+        return _cache
+
+MODEL_ID = "gemini-2.0-flash-exp"
+# PDFs above this size are cut down to their first pages before upload
+TRIM_THRESHOLD = 512 * 1024
+# Gemini's inline-part limit; bigger PDFs go through the File API instead
+MAX_INLINE_BYTES = 20 * 1024 * 1024
+# CO/CQ metadata (date, serials) lives on the first page or two
+MAX_PAGES = 2
+# Concurrent Gemini requests; size to (requests-per-minute quota / 60) * avg latency in seconds
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+
+# Enhanced prompt for scanned/photo PDFs
+_PROMPT = """
+You are a specialized document OCR agent for CO (Certificate of Origin) and CQ (Certificate of Quality).
+Your task is to extract exact metadata from the provided PDF, which may be a scanned photo, blurry, or low-quality.
+
+Search for:
+1. Date: The document issue date or certificate date. Format as YYYY-MM-DD.
+2. Serial Numbers: Any identifying numbers like Lot No, Serial No, Heat No, Certificate No.
+   - Extract the full value.
+   - If it's for a specific component (e.g., Tube, Steel, Plate), format it as "Value (Component)".
+
+CRITICAL: 
+- If the text is rotated or blurry, do your best to read it.
+- Only return data you are confident in. Use null if not found.
+- Return ONLY a JSON object with keys "date" and "serial_number" (list of strings).
+"""
+
+_CLIENT = None
+
+def _get_client():
+    """Returns the shared Gemini client, creating it on first use (reuses its connection pool)."""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    return _CLIENT
+
+# System prompt is uploaded once as a cached_content resource and referenced by name
+PROMPT_CACHE_TTL = 3600
+# After a transient failure to create the cache, the prompt is sent inline for this long
+PROMPT_CACHE_RETRY = 300
+_prompt_cache = {"name": None, "expires_at": 0.0, "retry_at": 0.0, "disabled": False}
+_prompt_cache_lock = threading.Lock()
+
+def _cached_prompt_name():
+    """
+    Returns the name of a Gemini cached_content resource holding _PROMPT,
+    recreating it shortly before it expires. Returns None when context caching
+    is unavailable, in which case the prompt is sent inline: for good if the API
+    rejects the request (e.g. prompt below the model's minimum cache size), for
+    PROMPT_CACHE_RETRY seconds after any other error.
+    """
+    with _prompt_cache_lock:
+        if _prompt_cache["disabled"] or time.time() < _prompt_cache["retry_at"]:
+            return None
+        if _prompt_cache["name"] and time.time() < _prompt_cache["expires_at"] - 60:
+            return _prompt_cache["name"]
+        try:
+            cached = _get_client().caches.create(
+                model=MODEL_ID,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=_PROMPT,
+                    ttl=f"{PROMPT_CACHE_TTL}s",
+                ),
+            )
+        except Exception as e:
+            if isinstance(e, errors.ClientError) and (e.code == 400 or e.status == "INVALID_ARGUMENT"):
+                # Permanent: this prompt/model can't be cached, stop asking
+                logging.info(f"Gemini context caching unavailable, sending prompt inline: {e}")
+                _prompt_cache["disabled"] = True
+            else:
+                logging.warning(f"Gemini prompt cache creation failed, retrying in {PROMPT_CACHE_RETRY}s: {e}")
+                _prompt_cache["retry_at"] = time.time() + PROMPT_CACHE_RETRY
+            return None
+        _prompt_cache["name"] = cached.name
+        _prompt_cache["expires_at"] = time.time() + PROMPT_CACHE_TTL
+        return cached.name
+
+class CoCqMeta(BaseModel):
+    """Response schema enforced on Gemini output."""
+    date: Optional[str] = None
+    serial_number: List[str] = []
+
+def _load_pdf(file_path, pdf_data):
+    """Returns (label, pdf_bytes) from either raw bytes or a path / binary file object."""
+    if pdf_data is not None:
+        return file_path or "<bytes>", pdf_data
+    if isinstance(file_path, str):
+        with open(file_path, "rb") as f:
+            return file_path, f.read()
+    file_path.seek(0)
+    return file_path, file_path.read()
+
+def _cache_key(pdf_data):
+    # Identical bytes (re-uploads, copies under another Drive ID) reuse the previous result
+    if blake3 is not None:
+        # Multi-threaded tree hashing only pays off on large scans
+        threads = blake3.blake3.AUTO if len(pdf_data) > 1024 * 1024 else 1
+        return f"{MODEL_ID}:blake3:{blake3.blake3(pdf_data, max_threads=threads).hexdigest()}"
+    return f"{MODEL_ID}:sha256:{hashlib.sha256(pdf_data).hexdigest()}"
+
+def _cache_lookup(pdf_data, label):
+    """Returns (cache_key, cached result or None) for the sync and async extractors."""
+    cache_key = _cache_key(pdf_data)
+    cached = _get_cache().get(cache_key)
+    if cached is not None:
+        logging.info(f"Gemini cache hit for {label}")
+    return cache_key, cached
+
+def _cache_store(cache_key, result):
+    """Caches a parsed result (failed parses are retried next time) and returns it."""
+    if result is not None:
+        _get_cache().set(cache_key, result, expire=CACHE_TTL)
+    return result
+
+def _first_pages(pdf_data):
+    """
+    Returns a copy of the PDF containing only the first MAX_PAGES pages when
+    it is larger than TRIM_THRESHOLD; otherwise (or if it can't be parsed)
+    the original bytes.
+    """
+    if len(pdf_data) <= TRIM_THRESHOLD:
+        return pdf_data
+    try:
+        source = pdfium.PdfDocument(pdf_data)
+        if len(source) <= MAX_PAGES:
+            return pdf_data
+        trimmed = pdfium.PdfDocument.new()
+        trimmed.import_pages(source, list(range(MAX_PAGES)))
+        out = io.BytesIO()
+        trimmed.save(out)
+        logging.info(f"Trimmed PDF from {len(source)} pages ({len(pdf_data) / 1024:.1f} KB) to {MAX_PAGES} pages ({out.tell() / 1024:.1f} KB)")
+        return out.getvalue()
+    except Exception as e:
+        logging.warning(f"Could not trim PDF, uploading it whole: {e}")
+        return pdf_data
+
+def _is_pdf(pdf_data):
+    # The %PDF- header may be preceded by junk, but must start within the first 1 KB
+    return b"%PDF-" in pdf_data[:1024]
+
+def _pdf_part(pdf_data, client):
+    """Inline part for normal PDFs; an uploaded File for ones above MAX_INLINE_BYTES."""
+    pdf_data = _first_pages(pdf_data)
+    if len(pdf_data) > MAX_INLINE_BYTES:
+        logging.info(f"PDF is {len(pdf_data) / 1024 / 1024:.1f} MB, uploading via the File API")
+        return client.files.upload(
+            file=io.BytesIO(pdf_data),
+            config=types.UploadFileConfig(mime_type="application/pdf"),
+        )
+    return types.Part.from_bytes(data=pdf_data, mime_type="application/pdf")
+
+def _request(pdf_data, client):
+    """
+    Keyword arguments for models.generate_content (shared by the sync and async clients).
+    May block on a File API upload or prompt cache creation.
+    """
+    pdf_part = _pdf_part(pdf_data, client)
+    # The prompt cache belongs to the shared client's project; injected clients send it inline
+    # (compared to _CLIENT itself, so an injected client never builds the shared one)
+    cached_prompt = _cached_prompt_name() if _CLIENT is not None and client is _CLIENT else None
+    if cached_prompt:
+        return {
+            "model": MODEL_ID,
+            "contents": [pdf_part],
+            "config": types.GenerateContentConfig(
+                cached_content=cached_prompt,
+                response_mime_type="application/json",
+                response_schema=CoCqMeta,
+            ),
+        }
+    return {
+        "model": MODEL_ID,
+        "contents": [pdf_part, _PROMPT],
+        "config": types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=CoCqMeta,
+        ),
+    }
+
+def _parse_response(response, label):
+    """Turns a Gemini response into { "date", "serial_number" }, or None if unusable."""
+    if response and response.parsed is not None:
+        logging.info(f"Gemini response received for {label}")
+        return response.parsed.model_dump()
+    elif response and response.text:
+        # Schema validation failed on the SDK side; the body is still plain JSON
+        logging.info(f"Gemini response received for {label} (unparsed)")
+        try:
+            data = orjson.loads(response.text)
+        except orjson.JSONDecodeError as je:
+            logging.error(f"JSON Decode Error for {label}: {je}. Raw: {response.text}")
+            return None
+        return {
+            "date": data.get("date"),
+            "serial_number": data.get("serial_number") or []
+        }
+    else:
+        logging.warning(f"Gemini returned empty response for {label}")
+        return None
+
+def extract_with_gemini(file_path=None, pdf_data=None, client=None):
     """
     Uses Google Gemini 2.0 Flash to extract Serial Number and Date from a PDF.
+    Pass either file_path (a path or binary file-like object) or the raw pdf_data bytes.
+    client defaults to the module's shared genai.Client.
     Returns: { "date": str or None, "serial_number": List[str] }
     """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    if not os.getenv("GOOGLE_API_KEY"):
         logging.warning("GOOGLE_API_KEY not found in .env. AI extraction skipped.")
         return None
 
+    label = file_path or "<bytes>"
     try:
-        client = genai.Client(api_key=api_key)
-        model_id = "gemini-2.0-flash-exp"
+        label, pdf_data = _load_pdf(file_path, pdf_data)
+        logging.info(f"Processing PDF for AI extraction: {label} ({len(pdf_data) / 1024:.1f} KB)")
+        if not _is_pdf(pdf_data):
+            logging.warning(f"Not a PDF, AI extraction skipped: {label}")
+            return None
 
-        # Reading file bytes
-        file_size = os.path.getsize(file_path)
-        logging.info(f"Processing PDF for AI extraction: {file_path} ({file_size / 1024:.1f} KB)")
-        
-        with open(file_path, "rb") as f:
-            pdf_data = f.read()
-
-        # Enhanced prompt for scanned/photo PDFs
-        prompt = """
-        You are a specialized document OCR agent for CO (Certificate of Origin) and CQ (Certificate of Quality).
-        Your task is to extract exact metadata from the provided PDF, which may be a scanned photo, blurry, or low-quality.
-
-        Search for:
-        1. Date: The document issue date or certificate date. Format as YYYY-MM-DD.
-        2. Serial Numbers: Any identifying numbers like Lot No, Serial No, Heat No, Certificate No.
-           - Extract the full value.
-           - If it's for a specific component (e.g., Tube, Steel, Plate), format it as "Value (Component)".
-        
-        CRITICAL: 
-        - If the text is rotated or blurry, do your best to read it.
-        - Only return data you are confident in. Use null if not found.
-        - Return ONLY a JSON object with keys "date" and "serial_number" (list of strings).
-        """
-
-        logging.info(f"Calling Gemini API for {file_path}...")
-        response = client.models.generate_content(
-            model=model_id,
-            contents=[
-                types.Part.from_bytes(data=pdf_data, mime_type="application/pdf"),
-                prompt
-            ],
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-            )
-        )
+        cache_key, cached = _cache_lookup(pdf_data, label)
+        if cached is not None:
+            return cached
+
+        logging.info(f"Calling Gemini API for {label}...")
+        client = client or _get_client()
+        response = client.models.generate_content(**_request(pdf_data, client))
+        return _cache_store(cache_key, _parse_response(response, label))
 
-        import json
-        if response and response.text:
-            logging.info(f"Gemini response received for {file_path}")
-            cleaned_text = response.text.strip()
-            # Handle markdown wrapping if it exists
-            if cleaned_text.startswith("```json"):
-                cleaned_text = cleaned_text[7:-3].strip()
-            elif cleaned_text.startswith("```"):
-                cleaned_text = cleaned_text[3:-3].strip()
-            
-            try:
-                data = json.loads(cleaned_text)
-                return {
-                    "date": data.get("date"),
-                    "serial_number": data.get("serial_number", [])
-                }
-            except json.JSONDecodeError as je:
-                logging.error(f"JSON Decode Error for {file_path}: {je}. Raw: {cleaned_text}")
-                return None
-        else:
-            logging.warning(f"Gemini returned empty response for {file_path}")
+    except Exception as e:
+        logging.error(f"Error in Gemini extraction for {label}: {e}")
+        return None
+
+async def extract_with_gemini_async(pdf_data, label="<bytes>", client=None):
+    """
+    Async variant of extract_with_gemini for in-memory PDFs.
+    Uses the shared client's aio interface so concurrent calls share one connection pool.
+    """
+    if not os.getenv("GOOGLE_API_KEY"):
+        logging.warning("GOOGLE_API_KEY not found in .env. AI extraction skipped.")
+        return None
+
+    try:
+        if not _is_pdf(pdf_data):
+            logging.warning(f"Not a PDF, AI extraction skipped: {label}")
             return None
 
+        cache_key, cached = _cache_lookup(pdf_data, label)
+        if cached is not None:
+            return cached
+
+        logging.info(f"Calling Gemini API for {label}...")
+        client = client or _get_client()
+        request = await asyncio.to_thread(_request, pdf_data, client)
+        response = await client.aio.models.generate_content(**request)
+        return _cache_store(cache_key, _parse_response(response, label))
+
     except Exception as e:
-        logging.error(f"Error in Gemini extraction for {file_path}: {e}")
+        logging.error(f"Error in Gemini extraction for {label}: {e}")
         return None
 
-    return None
+async def extract_many_with_gemini_async(pdfs, concurrency=GEMINI_CONCURRENCY, client=None):
+    """
+    Runs extract_with_gemini_async over (label, pdf_bytes) pairs with at most
+    `concurrency` requests in flight. Returns results in input order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(label, pdf_data):
+        async with semaphore:
+            return await extract_with_gemini_async(pdf_data, label=label, client=client)
+
+    return await asyncio.gather(*[run(label, pdf_data) for label, pdf_data in pdfs])
@@ -1,9 +1,13 @@
 import streamlit as st
+import asyncio
 import time
+from collections import deque
 from datetime import datetime
 import pandas as pd
 import os
-import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dotenv import load_dotenv
 from src import drive_scanner, extractor, sheets
 
@@ -15,6 +19,25 @@ load_dotenv()
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Max number of files downloaded/extracted at the same time
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "8"))
+# Worker processes for CPU-bound extraction (pdfplumber, regex, Tesseract OCR)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", max(2, (os.cpu_count() or 2) - 1)))
+# Parallel Drive downloads; downloaded PDFs wait in memory (at most this many) for a free extractor
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))
+# Continuous mode flushes rows to Sheets once this many are pending
+SYNC_BATCH_SIZE = 50
+# Column layout of session rows and of the destination sheet
+SESSION_COLUMNS = ["File Name", "Date", "Serial Number", "Method", "Drive Link", "Content Hash"]
+SHEET_COLUMNS = sheets.HEADERS
+# Continuous mode re-reads the sheet's Drive links at most this often (catches out-of-band edits)
+LINKS_REFRESH_SECONDS = 3600
+# Folder listings larger than this are de-duplicated with pandas instead of a comprehension
+VECTORIZED_FILTER_MIN = 2000
+# Continuous mode reads only the Drive changes feed between full walks, which happen at most this far apart
+# (a full walk also retries files whose extraction or sync failed)
+FULL_RESCAN_SECONDS = 3600
+
 st.set_page_config(page_title="CO/CQ Automator", layout="wide")
 
 st.title("📄 CO/CQ Automator")
@@ -36,9 +59,148 @@ recursive_search = st.sidebar.checkbox("📂 Recursive Search", value=False)
 if mode == "Continuous Monitor":
     scan_interval = st.sidebar.number_input("Scan Interval (minutes)", min_value=1, value=10, step=1)
 
+@st.cache_data(ttl=300, show_spinner=False)
+def list_folder(folder_id, recursive):
+    """Cached Drive listing as [(folder_name, files)] so widget reruns don't re-walk the tree."""
+    return list(drive_scanner.walk_folder_structure(folder_id, recursive=recursive))
+
+if st.sidebar.button("🔄 Refresh Drive Listing"):
+    list_folder.clear()
+
 # Session State
 if 'extracted_data' not in st.session_state:
-    st.session_state['extracted_data'] = []
+    # Column-oriented (one list per SESSION_COLUMNS entry) so the preview DataFrame is built without transposing rows
+    st.session_state['extracted_data'] = {col: [] for col in SESSION_COLUMNS}
+
+def to_sheet_rows(df):
+    """Converts a session DataFrame to Sheets rows (list of lists), keeping missing values as None."""
+    rows = df[SHEET_COLUMNS].astype(object)
+    return rows.where(rows.notna(), None).values.tolist()
+
+def filter_new_files(files, existing_ids, existing_hashes=frozenset()):
+    """
+    Returns the files whose Drive ID is not in existing_ids and whose content
+    (Drive md5Checksum) is not in existing_hashes, so copies and re-uploads are skipped too.
+    Large listings are filtered with a vectorized isin; below
+    VECTORIZED_FILTER_MIN the plain comprehension is cheaper than building a DataFrame.
+    """
+    if len(files) <= VECTORIZED_FILTER_MIN:
+        return [f for f in files if f['id'] not in existing_ids and f.get('md5Checksum') not in existing_hashes]
+    listing = pd.DataFrame({'id': [f['id'] for f in files], 'md5': [f.get('md5Checksum') for f in files]})
+    mask = ~(listing['id'].isin(existing_ids) | listing['md5'].isin(existing_hashes)).to_numpy()
+    return [f for f, keep in zip(files, mask) if keep]
+
+def get_known_file_ids(spreadsheet_id):
+    """
+    Returns the session's (file IDs, content hashes) already present in the sheet.
+    The sheet is only re-read when the cache is older than LINKS_REFRESH_SECONDS;
+    callers add newly synced IDs and hashes to the returned sets themselves.
+    """
+    cache = st.session_state.get('known_file_ids')
+    if not cache or cache['sheet'] != spreadsheet_id or time.time() - cache['fetched_at'] > LINKS_REFRESH_SECONDS:
+        cache = {
+            'sheet': spreadsheet_id,
+            'ids': sheets.get_existing_drive_ids(spreadsheet_id),
+            'hashes': sheets.get_existing_content_hashes(spreadsheet_id),
+            'fetched_at': time.time(),
+        }
+        st.session_state['known_file_ids'] = cache
+    return cache['ids'], cache['hashes']
+
+@st.cache_resource
+def get_extraction_pool():
+    """
+    Process pool shared across reruns and sessions so OCR/parsing runs on all
+    cores without holding the GIL of the Streamlit thread. Uses 'spawn' so
+    workers don't inherit the server's threads.
+    """
+    return ProcessPoolExecutor(
+        max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+        initializer=extractor.init_extraction_worker,
+    )
+
+async def extract_in_pool(pdf_bytes, force_ocr):
+    """
+    Runs extract_data_bytes in the shared process pool. A pool broken by a dead worker
+    (OOM, a crash inside Tesseract) would fail every later scan, so it is replaced
+    and the file retried once.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    try:
+        return await loop.run_in_executor(pool, extractor.extract_data_bytes, pdf_bytes, force_ocr)
+    except BrokenProcessPool:
+        logging.warning("Extraction worker died; restarting the process pool")
+        # Concurrent failures see the same broken pool; only the first replaces it
+        if get_extraction_pool() is pool:
+            get_extraction_pool.clear()
+            pool.shutdown(wait=False, cancel_futures=True)
+        return await loop.run_in_executor(get_extraction_pool(), extractor.extract_data_bytes, pdf_bytes, force_ocr)
+
+async def process_files(files, on_start, on_result, force_ocr=False):
+    """
+    Downloads and extracts files concurrently (bounded by MAX_CONCURRENCY).
+    Downloads run in worker threads and extraction in the process pool as a
+    pipeline: up to DOWNLOAD_CONCURRENCY files keep downloading while earlier
+    ones are being extracted, so neither the network nor the CPU sits idle.
+    on_start(file) and on_result(file, data, method, error) are called from the event loop so
+    Streamlit elements can be updated safely as results stream in.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    download_slots = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    # Bounds downloaded-but-not-yet-extracted PDFs held in memory
+    buffer_slots = asyncio.Semaphore(EXTRACT_WORKERS + DOWNLOAD_CONCURRENCY)
+    results = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+    # Byte-identical files (same Drive md5Checksum) reuse the earlier result without downloading
+    md5_results = st.session_state.setdefault('md5_results', {})
+    # ...including copies in this batch whose first instance is still being extracted
+    in_flight = {}
+
+    async def process_file(file):
+        async with semaphore:
+            on_start(file)
+            md5 = file.get('md5Checksum')
+            cache_key = (md5, force_ocr)
+            if md5 and cache_key in md5_results:
+                await results.put((file, *md5_results[cache_key], None))
+                return
+            if md5 and cache_key in in_flight:
+                try:
+                    data, method = await asyncio.shield(in_flight[cache_key])
+                    await results.put((file, data, method, None))
+                except Exception as e:
+                    await results.put((file, None, None, e))
+                return
+            pending = None
+            if md5:
+                pending = in_flight[cache_key] = loop.create_future()
+            try:
+                async with buffer_slots:
+                    async with download_slots:
+                        pdf_bytes = await asyncio.to_thread(drive_scanner.download_bytes, file['id'])
+                    data, method = await extract_in_pool(pdf_bytes, force_ocr)
+                if md5:
+                    md5_results[cache_key] = (data, method)
+                    pending.set_result((data, method))
+                await results.put((file, data, method, None))
+            except Exception as e:
+                if pending is not None:
+                    pending.set_exception(e)
+                    # Marks it retrieved: there may be no copies waiting for it
+                    pending.exception()
+                await results.put((file, None, None, e))
+            finally:
+                if pending is not None:
+                    if not pending.done():
+                        pending.cancel()
+                    del in_flight[cache_key]
+
+    async def consume():
+        for _ in range(len(files)):
+            on_result(*(await results.get()))
+
+    await asyncio.gather(consume(), *[process_file(f) for f in files])
 
 # --- MANUAL MODE ---
 if mode == "Manual Scan":
@@ -47,11 +209,16 @@ if mode == "Manual Scan":
             st.error("Please provide a Google Drive Folder ID.")
         else:
             try:
-                # 1. Fetch existing data for deduplication
-                existing_links = set()
+                # A new scan must see files added since the last listing
+                list_folder.clear()
+
+                # 1. Fetch existing data for deduplication (read-only for the rest of the scan)
+                existing_ids = existing_hashes = frozenset()
                 if spreadsheet_id:
                     with st.spinner("Fetching existing data to check for duplicates..."):
-                        existing_links = sheets.get_existing_drive_links(spreadsheet_id)
+                        existing_ids = frozenset(sheets.get_existing_drive_ids(spreadsheet_id))
+                        existing_hashes = frozenset(sheets.get_existing_content_hashes(spreadsheet_id))
+                        sheets.prepare_sheet(spreadsheet_id)
 
                 # Initialize counters
                 total_new_files = 0
@@ -67,50 +234,34 @@ if mode == "Manual Scan":
                 # Helper to process a batch of files
                 def process_batch(files_to_process, folder_name):
                     folder_new_data = []
-                    count = len(files_to_process)
-                    
-                    for i, file in enumerate(files_to_process):
-                        file_name = file['name']
-                        web_link = file['webViewLink']
-                        
-                        status_msg = f"Reading {file_name} in '{folder_name}'..."
-                        if force_ocr: status_msg = f"🔍 OCR on {file_name} in '{folder_name}'..."
-                        
+
+                    def on_start(file):
+                        status_msg = f"Reading {file['name']} in '{folder_name}'..."
+                        if force_ocr: status_msg = f"🔍 OCR on {file['name']} in '{folder_name}'..."
                         status_text.text(status_msg)
-                        
-                        # Download & Extract
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                            temp_path = tmp.name
-                            
-                        try:
-                            drive_scanner.download_file(file['id'], temp_path)
-                            data, method = extractor.extract_data(temp_path, force_ocr=force_ocr)
-                            
-                            row = {
-                                "File Name": file_name,
-                                "Date": data.get("date"),
-                                "Serial Number": data.get("serial_number"),
-                                "Method": method,
-                                "Drive Link": web_link,
-                            }
-                            folder_new_data.append(row)
-                            st.write(f"✅ Processed {file_name}")
-                            
-                        except Exception as e:
-                            st.warning(f"Failed to process {file_name}: {e}")
-                        finally:
-                            if os.path.exists(temp_path): os.remove(temp_path)
-                            
+
+                    def on_result(file, data, method, error):
+                        file_name = file['name']
+                        if error:
+                            st.warning(f"Failed to process {file_name}: {error}")
+                            return
+
+                        # Same order as SESSION_COLUMNS
+                        row = [file_name, data.get("date"), data.get("serial_number"), method, file['webViewLink'], file.get('md5Checksum')]
+                        folder_new_data.append(row)
+                        st.write(f"✅ Processed {file_name}")
+
+                    asyncio.run(process_files(files_to_process, on_start, on_result, force_ocr=force_ocr))
                     return folder_new_data
 
                 # Main Loop
                 st.info("Scanning started... folders will be processed one by one.")
                 
-                for folder_name, files in drive_scanner.walk_folder_structure(drive_folder_id, recursive=recursive_search):
+                for folder_name, files in list_folder(drive_folder_id, recursive_search):
                     status_text.text(f"Scanning folder: {folder_name}...")
                     
                     # Filter duplicates for this batch
-                    new_files = [f for f in files if f['webViewLink'] not in existing_links]
+                    new_files = filter_new_files(files, existing_ids, existing_hashes)
                     
                     if new_files:
                         st.info(f"📂 Found {len(new_files)} new files in '{folder_name}'. Processing...")
@@ -118,19 +269,17 @@ if mode == "Manual Scan":
                         
                         if batch_data:
                             # Add to session state for preview
-                            st.session_state['extracted_data'].extend(batch_data)
+                            session_data = st.session_state['extracted_data']
+                            for col, values in zip(SESSION_COLUMNS, zip(*batch_data)):
+                                session_data[col].extend(values)
                             
                             # Auto-Sync Implementation for Manual Mode? 
                             # User only asked for "scanning one sub-folder at a time to ensure syncing". 
                             # Let's sync IMMEDIATELY to sheet if ID is present.
                             if spreadsheet_id:
                                 try:
-                                    rows_to_sync = [[
-                                        item["File Name"],
-                                        item["Date"],
-                                        item["Serial Number"],
-                                        item["Drive Link"]
-                                    ] for item in batch_data]
+                                    # Session row minus the Method column
+                                    rows_to_sync = [[name, date, serial, link, md5] for name, date, serial, _, link, md5 in batch_data]
                                     
                                     sheets.append_data_to_sheet(spreadsheet_id, rows_to_sync)
                                     st.success(f"💾 Synced {len(rows_to_sync)} rows from '{folder_name}' to Sheets.")
@@ -152,105 +301,198 @@ if mode == "Manual Scan":
                 st.error(f"Error during processing: {e}")
 
     # Display Data (Accumulated)
-    if st.session_state['extracted_data']:
+    if st.session_state['extracted_data']["File Name"]:
         st.subheader("Session Data Preview")
-        df = pd.DataFrame(st.session_state['extracted_data'])
-        st.dataframe(df[["File Name", "Date", "Serial Number", "Method", "Drive Link"]])
+        df = pd.DataFrame(st.session_state['extracted_data'], columns=SESSION_COLUMNS)
+        st.dataframe(df)
         
         # We don't need a manual Sync button anymore if we auto-synced, or we keep it for safety?
         # Let's keep it but label it "Re-Sync Session Data"
         if st.button("💾 Re-Sync All Session Data"):
-             # ... (existing sync logic) ...
-             pass
+            if not spreadsheet_id:
+                st.error("Please provide a Google Sheet ID.")
+            else:
+                try:
+                    # Only rows whose file isn't in the sheet yet (e.g. a batch whose sync failed)
+                    existing_ids = sheets.get_existing_drive_ids(spreadsheet_id)
+                    missing = ~df["Drive Link"].map(sheets.drive_file_id).isin(existing_ids)
+                    rows_to_sync = to_sheet_rows(df[missing])
+                    if rows_to_sync:
+                        sheets.prepare_sheet(spreadsheet_id)
+                        sheets.append_data_to_sheet(spreadsheet_id, rows_to_sync)
+                    st.success(f"💾 Re-synced {len(rows_to_sync)} missing rows to Sheets.")
+                except Exception as e:
+                    st.error(f"Re-sync failed: {e}")
 
 # --- CONTINUOUS MONITOR MODE ---
 elif mode == "Continuous Monitor":
     st.info(f"🔄 System will scan NEW files incrementally (folder by folder) every {scan_interval} minutes.")
     
     if st.button("🔴 Start Monitoring Loop"):
+        st.session_state['monitoring'] = True
+        # Each monitoring run starts from a fresh read of the sheet (picks up manual edits) and a full walk
+        st.session_state.pop('known_file_ids', None)
+        st.session_state.pop('drive_cursor', None)
+
+    if st.session_state.get('monitoring'):
+        # Clicking Stop triggers a rerun, which interrupts the loop at its next UI update
+        if st.button("🛑 Stop Monitoring"):
+            st.session_state['monitoring'] = False
+            st.rerun()
+
         status_placeholder = st.empty()
         log_placeholder = st.empty()
-        logs = []
+        # Newest first; keeps the last 50 logs
+        logs = deque(maxlen=50)
 
         def log(msg):
             timestamp = datetime.now().strftime("%H:%M:%S")
-            logs.insert(0, f"[{timestamp}] {msg}")
-            # Keep last 50 logs
-            if len(logs) > 50: logs.pop()
+            logs.appendleft(f"[{timestamp}] {msg}")
             log_placeholder.code("\n".join(logs), language="text")
 
-        while True:
-            try:
-                # 1. Check for duplicates
-                existing_links = set()
+        async def sleep_with_countdown(seconds):
+            # Sleep in short ticks with a UI update each time so Streamlit can stop us mid-sleep
+            wake_at = time.time() + seconds
+            while (remaining := wake_at - time.time()) > 0:
+                status_placeholder.success(f"Sleeping... next scan in {int(remaining // 60)}m {int(remaining % 60):02d}s")
+                await asyncio.sleep(min(1, remaining))
+
+        async def process_folder(folder_name, files, existing_ids, existing_hashes):
+            """Extracts and syncs the files of one folder that aren't in the sheet yet; returns the number synced."""
+            new_files = filter_new_files(files, existing_ids, existing_hashes)
+            if not new_files:
+                return 0
+
+            log(f"📂 {folder_name}: Found {len(new_files)} new files.")
+            synced = 0
+
+            # Rows are synced in one append per folder (or per SYNC_BATCH_SIZE rows)
+            pending_rows = []
+
+            def flush_pending():
+                nonlocal synced
+                if not pending_rows:
+                    return
+                try:
+                    sheets.append_data_to_sheet(spreadsheet_id, pending_rows)
+                    log(f"💾 Synced {len(pending_rows)} rows from '{folder_name}'.")
+                    synced += len(pending_rows)
+                except Exception as e:
+                    log(f"❌ Sync failed for {len(pending_rows)} rows from '{folder_name}': {e}")
+                    # Let the next full walk pick these files up again
+                    existing_ids.difference_update(sheets.drive_file_id(row[3]) for row in pending_rows)
+                    existing_hashes.difference_update(row[4] for row in pending_rows)
+                pending_rows.clear()
+
+            def on_start(file):
+                status_placeholder.info(f"Processing: {file['name']} ({folder_name})...")
+
+            def on_result(file, data, method, error):
+                file_name = file['name']
+                web_link = file['webViewLink']
+                if error:
+                    log(f"❌ Error {file_name}: {error}")
+                    return
+
                 if spreadsheet_id:
-                    status_placeholder.info("Fetching existing records...")
-                    existing_links = sheets.get_existing_drive_links(spreadsheet_id)
-                
-                # 2. Walk Drive
-                status_placeholder.info("Starting incremental scan...")
-                
-                files_found_in_loop = 0
-                
-                for folder_name, files in drive_scanner.walk_folder_structure(drive_folder_id, recursive=recursive_search):
-                    status_placeholder.info(f"Scanning: {folder_name} ...")
-                    
-                    # Filter
-                    new_files = [f for f in files if f['webViewLink'] not in existing_links]
-                    
-                    if new_files:
-                        log(f"📂 {folder_name}: Found {len(new_files)} new files.")
-                        
-                        for file in new_files:
-                            file_name = file['name']
-                            web_link = file['webViewLink']
-                            
-                            status_placeholder.info(f"Processing: {file_name} ({folder_name})...")
-                            
-                            # Download & Extract
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                                temp_path = tmp.name
-                            
-                            try:
-                                drive_scanner.download_file(file['id'], temp_path)
-                                data, method = extractor.extract_data(temp_path, force_ocr=force_ocr)
-                                
-                                # Immediate Sync
-                                row_data = [[
-                                    file_name,
-                                    data.get("date"),
-                                    data.get("serial_number"),
-                                    web_link
-                                ]]
-                                
-                                if spreadsheet_id:
-                                    sheets.append_data_to_sheet(spreadsheet_id, row_data)
-                                    log(f"✅ Synced: {file_name}")
-                                    files_found_in_loop += 1
-                                    
-                                    # Add to local cache to prevent re-processing separate dups in same loop?
-                                    existing_links.add(web_link) 
-                                else:
-                                    log(f"⚠️ Skipped Sync (No ID): {file_name}")
-                                    
-                            except Exception as e:
-                                log(f"❌ Error {file_name}: {e}")
-                            finally:
-                                if os.path.exists(temp_path): os.remove(temp_path)
-                    
-                    # Yielding back to loop allows "breathing room" or UI updates if needed
-                
-                if files_found_in_loop == 0:
-                     log("Scan complete. No new files.")
+                    pending_rows.append([
+                        file_name,
+                        data.get("date"),
+                        data.get("serial_number"),
+                        web_link,
+                        file.get('md5Checksum')
+                    ])
+                    log(f"✅ Extracted: {file_name}")
+
+                    # Add to local cache to prevent re-processing separate dups in same loop
+                    existing_ids.add(file['id'])
+                    if file.get('md5Checksum'):
+                        existing_hashes.add(file['md5Checksum'])
+
+                    if len(pending_rows) >= SYNC_BATCH_SIZE:
+                        flush_pending()
                 else:
-                     log(f"Loop complete. Synced {files_found_in_loop} files.")
+                    log(f"⚠️ Skipped Sync (No ID): {file_name}")
 
-                status_placeholder.success(f"Sleeping for {scan_interval} minutes...")
-                time.sleep(scan_interval * 60)
-                
-            except Exception as e:
-                log(f"Critical Error: {e}")
-                time.sleep(60) # Retry after 1 min on error
+            try:
+                await process_files(new_files, on_start, on_result, force_ocr=force_ocr)
+            finally:
+                # Sync whatever was extracted even if processing the folder blew up
+                flush_pending()
+            return synced
+
+        def full_walk():
+            """
+            Walks the whole folder tree, yielding (folder_name, files).
+            Once the walk completes, a changes-feed cursor taken before it started is
+            stored, so the following scans only need to read what changed since.
+            A walk with failed listings stores no cursor: the next scan walks again.
+            """
+            cursor = {
+                'folder': drive_folder_id,
+                'recursive': recursive_search,
+                'token': drive_scanner.get_start_page_token(),
+                'folder_ids': set(),
+                'walked_at': time.time(),
+            }
+            failed = []
+            for folder_id, folder_name, files in drive_scanner.walk_folders(drive_folder_id, recursive=recursive_search, failed=failed):
+                cursor['folder_ids'].add(folder_id)
+                yield folder_name, files
+            if failed:
+                log(f"{len(failed)} folder listing(s) failed; the next scan walks the tree again.")
+                return
+            st.session_state['drive_cursor'] = cursor
+
+        def changed_files(cursor):
+            # Dropped while reading so that a failure (e.g. an expired token) falls back to a full walk
+            del st.session_state['drive_cursor']
+            files, cursor['token'] = drive_scanner.get_changes(
+                cursor['token'], cursor['folder_ids'], track_subfolders=recursive_search
+            )
+            st.session_state['drive_cursor'] = cursor
+            return [("Drive changes", files)]
+
+        async def monitor_loop():
+            headers_ready = False
+            while True:
+                try:
+                    # 1. Check for duplicates (cached across loop iterations)
+                    existing_ids, existing_hashes = set(), set()
+                    if spreadsheet_id:
+                        status_placeholder.info("Checking existing records...")
+                        existing_ids, existing_hashes = get_known_file_ids(spreadsheet_id)
+                        if not headers_ready:
+                            headers_ready = sheets.prepare_sheet(spreadsheet_id)
+
+                    # 2. Walk Drive, or only read its changes feed when a recent full walk covered this folder
+                    cursor = st.session_state.get('drive_cursor')
+                    if (cursor and cursor['folder'] == drive_folder_id and cursor['recursive'] == recursive_search
+                            and time.time() - cursor['walked_at'] < FULL_RESCAN_SECONDS):
+                        status_placeholder.info("Checking Drive for changes...")
+                        folders = changed_files(cursor)
+                    else:
+                        status_placeholder.info("Starting incremental scan...")
+                        folders = full_walk()
+
+                    files_found_in_loop = 0
+
+                    for folder_name, files in folders:
+                        status_placeholder.info(f"Scanning: {folder_name} ...")
+                        files_found_in_loop += await process_folder(folder_name, files, existing_ids, existing_hashes)
+
+                    if files_found_in_loop == 0:
+                         log("Scan complete. No new files.")
+                    else:
+                         log(f"Loop complete. Synced {files_found_in_loop} files.")
+
+                    await sleep_with_countdown(scan_interval * 60)
+
+                except Exception as e:
+                    log(f"Critical Error: {e}")
+                    await sleep_with_countdown(60) # Retry after 1 min on error
+
+        asyncio.run(monitor_loop())
 
 st.sidebar.markdown("---")
 st.sidebar.info("Admin Portal v2.0")
@@ -1,4 +1,5 @@
 import os.path
+import threading
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -36,6 +37,19 @@ def authenticate_google_drive():
 
     return creds
 
+# One set of credentials for the whole process: the login/refresh above writes token.json
+# and the consent flow binds port 8080, so it must not run once per worker thread
+_creds = None
+_creds_lock = threading.Lock()
+
+def get_credentials():
+    """Returns the process-wide credentials, authenticating on first use (thread-safe)."""
+    global _creds
+    with _creds_lock:
+        if _creds is None or not _creds.valid:
+            _creds = authenticate_google_drive()
+        return _creds
+
 if __name__ == '__main__':
     try:
         creds = authenticate_google_drive()
@@ -1,35 +1,90 @@
+import io
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from src.auth import authenticate_google_drive
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload
+from src.auth import get_credentials
 
-_service_cache = None
+# One service per thread: its httplib2 connection is kept alive between calls
+# but is not safe to share across threads (downloads run in a thread pool)
+_local = threading.local()
+
+# The Drive batch endpoint accepts at most 100 calls per HTTP request
+BATCH_LIMIT = 100
+# Batches of one folder level that are sent concurrently
+LISTING_WORKERS = 8
+# Media downloads fetch this much per HTTP range request (the library default is 100 KB)
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# files.list page size (Drive's maximum; the default is 100)
+PAGE_SIZE = 1000
+# Only the fields the app reads; the query already restricts the MIME type
+MATCHING_FILE_FIELDS = 'nextPageToken, files(id, name, webViewLink, md5Checksum)'
+# Transient Drive errors (rate limits, server errors) are retried with exponential backoff
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 6
+# Folder names are remembered across walks for this long (seconds)
+FOLDER_NAME_TTL = 3600
+_folder_names = {}
+
+# File types and name fragments the scanner looks for
+MIME_TYPES = ("application/pdf", "image/jpeg", "image/png")
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# 'CO', 'CQ' or 'COCQ' as a standalone token (digits, '_', '-', '.' etc. count as separators).
+# Drive's name contains also matches words that merely start with CO (e.g. 'Contract'), so
+# listings are re-filtered with this before anything gets downloaded
+_NAME_RE = re.compile(r"(?:^|[^a-z])(?:cocq|co|cq)(?:$|[^a-z])", re.IGNORECASE)
+CHANGE_FIELDS = 'nextPageToken, newStartPageToken, changes(file(id, name, webViewLink, md5Checksum, mimeType, parents, trashed))'
 
 def get_drive_service():
-    """Returns an authorized Drive API service instance."""
-    global _service_cache
-    if _service_cache:
-        return _service_cache
-    creds = authenticate_google_drive()
-    _service_cache = build('drive', 'v3', credentials=creds)
-    return _service_cache
+    """Returns an authorized Drive API service instance for the current thread."""
+    service = getattr(_local, 'service', None)
+    if service is None:
+        # Credentials are shared; only the (non-thread-safe) HTTP client is per thread
+        http = AuthorizedHttp(get_credentials(), http=httplib2.Http())
+        # Builds from the discovery document bundled with google-api-python-client>=2.0 (its
+        # default), so there is no HTTP fetch per build and no discovery cache to consult
+        service = _local.service = build('drive', 'v3', http=http, cache_discovery=False)
+    return service
+
+def _is_retryable(error):
+    """True for rate-limit and server errors; a 403 only counts when it is a rate limit."""
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status == 403:
+        return b"ratelimitexceeded" in (error.content or b"").lower()
+    return status in RETRYABLE_STATUSES
+
+def _backoff(attempt):
+    time.sleep(min(60, 2 ** attempt) + random.random())
+
+def _execute_with_backoff(request, retries=MAX_RETRIES):
+    """Executes a Drive request, retrying transient errors; re-raises once retries run out."""
+    for attempt in range(retries):
+        try:
+            return request.execute()
+        except HttpError as e:
+            if not _is_retryable(e):
+                raise
+            _backoff(attempt)
+    return request.execute()
 
 def _build_base_query(folder_id=None):
     """Builds the file search query string."""
-    # Mime types to look for
-    mime_types = [
-        "application/pdf", 
-        "image/jpeg", 
-        "image/png"
-    ]
-    
-    # Name contains 'CO', 'CQ' or 'cocq'
+    # Name contains 'CO' or 'CQ' (case-insensitive, so 'cocq' is already covered by 'CO')
     name_queries = [
         "name contains 'CO'",
-        "name contains 'CQ'",
-        "name contains 'cocq'"
+        "name contains 'CQ'"
     ]
     name_query = f"({' or '.join(name_queries)})"
     
-    mime_query_parts = [f"mimeType = '{m}'" for m in mime_types]
+    mime_query_parts = [f"mimeType = '{m}'" for m in MIME_TYPES]
     mime_query = f"({' or '.join(mime_query_parts)})"
     
     query = f"{name_query} and {mime_query} and trashed = false"
@@ -49,51 +104,242 @@ def _list_files_matching_criteria(folder_id):
     
     while True:
         try:
-            response = service.files().list(
+            response = _execute_with_backoff(service.files().list(
                 q=query,
                 spaces='drive',
-                fields='nextPageToken, files(id, name, webViewLink, mimeType)',
+                fields=MATCHING_FILE_FIELDS,
                 pageToken=page_token,
+                pageSize=PAGE_SIZE,
                 supportsAllDrives=True,
                 includeItemsFromAllDrives=True
-            ).execute()
+            ))
             
             files = response.get('files', [])
-            results.extend(files)
+            results.extend(f for f in files if _name_matches(f))
             
             page_token = response.get('nextPageToken', None)
             if page_token is None:
                 break
-        except Exception as e:
+        except HttpError as e:
             print(f"Error listing files in {folder_id}: {e}")
             break
     return results
 
+def _cached_folder_name(folder_id):
+    """Returns the remembered name of a folder, or None if unknown or older than FOLDER_NAME_TTL."""
+    entry = _folder_names.get(folder_id)
+    if entry and time.time() - entry[1] < FOLDER_NAME_TTL:
+        return entry[0]
+    return None
+
+def _remember_folder_name(folder_id, name):
+    _folder_names[folder_id] = (name, time.time())
+
 def get_folder_name(folder_id):
     """Gets the name of a folder by ID."""
+    name = _cached_folder_name(folder_id)
+    if name is not None:
+        return name
     try:
         service = get_drive_service()
-        file = service.files().get(fileId=folder_id, fields='name').execute()
-        return file.get('name', 'Unknown Folder')
-    except:
+        file = _execute_with_backoff(service.files().get(fileId=folder_id, fields='name'))
+        name = file.get('name', 'Unknown Folder')
+    except HttpError:
         return 'Unknown Folder'
+    _remember_folder_name(folder_id, name)
+    return name
 
 def walk_folder_structure(folder_id, recursive=False):
     """
     Generator that yields (folder_name, files_list) for the given folder
     and its subfolders (if recursive).
     """
-    # 1. Yield current folder's files
-    current_files = _list_files_matching_criteria(folder_id)
-    folder_name = get_folder_name(folder_id)
-    
-    yield folder_name, current_files
-    
-    # 2. Recurse if needed
-    if recursive:
-        subfolders = get_subfolders(folder_id)
-        for sub in subfolders:
-            yield from walk_folder_structure(sub['id'], recursive=True)
+    for _, folder_name, files in walk_folders(folder_id, recursive):
+        yield folder_name, files
+
+def walk_folders(folder_id, recursive=False, failed=None):
+    """
+    Like walk_folder_structure, but yields (folder_id, folder_name, files_list).
+
+    Folders are walked breadth-first: for every level, the name, file listing
+    and subfolder listing of all its folders go out as batch requests
+    (up to BATCH_LIMIT calls per HTTP round-trip, with several batches in
+    flight at once on wide levels) instead of one call each.
+    A folder reachable from several parents is walked once.
+
+    Listings that still fail after retries are yielded as empty (or partial);
+    pass a list as failed to have their (kind, folder_id) pairs appended to it,
+    so a caller can tell an incomplete walk from a complete one.
+    """
+    frontier = [folder_id]
+    visited = {folder_id}
+
+    while frontier:
+        # Names seen on an earlier scan (Continuous mode re-walks the same tree) aren't fetched again
+        names = {fid: name for fid in frontier if (name := _cached_folder_name(fid)) is not None}
+        files = {fid: [] for fid in frontier}
+        subfolders = {fid: [] for fid in frontier}
+        listings = {'files': files, 'subfolders': subfolders}
+
+        pending = [('name', fid, None) for fid in frontier if fid not in names]
+        pending += [('files', fid, None) for fid in frontier]
+        if recursive:
+            pending += [('subfolders', fid, None) for fid in frontier]
+
+        # Keep batching until every listing has been paged through
+        while pending:
+            responses = _execute_batch(pending)
+            next_pending = []
+            for kind, fid, _ in pending:
+                response = responses.get(f"{kind}:{fid}")
+                if response is None:
+                    if failed is not None and kind != 'name':
+                        failed.append((kind, fid))
+                    continue
+                if kind == 'name':
+                    names[fid] = response.get('name', 'Unknown Folder')
+                    _remember_folder_name(fid, names[fid])
+                    continue
+                found = response.get('files', [])
+                if kind == 'files':
+                    found = [f for f in found if _name_matches(f)]
+                listings[kind][fid].extend(found)
+                page_token = response.get('nextPageToken')
+                if page_token:
+                    next_pending.append((kind, fid, page_token))
+            pending = next_pending
+
+        for fid in frontier:
+            yield fid, names.get(fid, 'Unknown Folder'), files[fid]
+
+        # Batch request IDs are per folder, so the next level must not repeat one
+        frontier = list(dict.fromkeys(
+            sub['id'] for fid in frontier for sub in subfolders[fid] if sub['id'] not in visited
+        ))
+        visited.update(frontier)
+
+def _folder_request(service, kind, folder_id, page_token=None):
+    """Builds the (unexecuted) request for one part of a folder's listing."""
+    if kind == 'name':
+        return service.files().get(fileId=folder_id, fields='name', supportsAllDrives=True)
+    if kind == 'files':
+        query = _build_base_query(folder_id)
+        fields = MATCHING_FILE_FIELDS
+    else:
+        query = f"'{folder_id}' in parents and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false"
+        # The walk only needs the IDs of subfolders
+        fields = 'nextPageToken, files(id)'
+    return service.files().list(
+        q=query,
+        spaces='drive',
+        fields=fields,
+        pageToken=page_token,
+        pageSize=PAGE_SIZE,
+        supportsAllDrives=True,
+        includeItemsFromAllDrives=True
+    )
+
+def _execute_batch(specs):
+    """
+    Executes (kind, folder_id, page_token) listing calls through the Drive batch endpoint.
+    Specs are split into batches of BATCH_LIMIT that run in parallel threads,
+    each on its own service. Returns {"kind:folder_id": response}; failed calls
+    are logged and left out.
+    """
+    chunks = [specs[start:start + BATCH_LIMIT] for start in range(0, len(specs), BATCH_LIMIT)]
+    if len(chunks) == 1:
+        return _execute_batch_chunk(chunks[0])
+
+    responses = {}
+    with ThreadPoolExecutor(max_workers=min(LISTING_WORKERS, len(chunks))) as executor:
+        for chunk_responses in executor.map(_execute_batch_chunk, chunks):
+            responses.update(chunk_responses)
+    return responses
+
+def _execute_batch_chunk(specs):
+    # Requests must be built on this thread's service: the batch runs over its HTTP connection
+    service = get_drive_service()
+    responses = {}
+
+    for attempt in range(MAX_RETRIES + 1):
+        retry_ids = set()
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                responses[request_id] = response
+            elif _is_retryable(exception) and attempt < MAX_RETRIES:
+                retry_ids.add(request_id)
+            else:
+                print(f"Error in batched request {request_id}: {exception}")
+
+        batch = service.new_batch_http_request(callback=callback)
+        for kind, fid, token in specs:
+            batch.add(_folder_request(service, kind, fid, token), request_id=f"{kind}:{fid}")
+        try:
+            _execute_with_backoff(batch)
+        except HttpError as e:
+            print(f"Error executing batch request: {e}")
+
+        # Calls that hit a transient error inside the batch go out again in a smaller batch
+        if not retry_ids:
+            break
+        specs = [spec for spec in specs if f"{spec[0]}:{spec[1]}" in retry_ids]
+        _backoff(attempt)
+    return responses
+
+def _name_matches(file):
+    return _NAME_RE.search(file.get('name', '')) is not None
+
+def matches_criteria(file):
+    """Applies the scanner's name/MIME filter to a file resource in Python."""
+    return (
+        file.get('mimeType') in MIME_TYPES
+        and not file.get('trashed')
+        and _name_matches(file)
+    )
+
+def get_start_page_token():
+    """Returns a changes-feed cursor pointing at 'now'."""
+    service = get_drive_service()
+    response = _execute_with_backoff(service.changes().getStartPageToken(supportsAllDrives=True))
+    return response['startPageToken']
+
+def get_changes(page_token, folder_ids, track_subfolders=False):
+    """
+    Reads the Drive changes feed from page_token.
+    Returns (files, new_page_token): the changed files that sit directly in one of
+    folder_ids and match the scanner's criteria. With track_subfolders, folders
+    that appear under a known folder are added to folder_ids, so later files
+    inside them are picked up too.
+    """
+    service = get_drive_service()
+    files = []
+
+    while True:
+        response = _execute_with_backoff(service.changes().list(
+            pageToken=page_token,
+            spaces='drive',
+            fields=CHANGE_FIELDS,
+            pageSize=PAGE_SIZE,
+            includeRemoved=False,
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True
+        ))
+
+        # Changes come oldest first, so a new folder is seen before the files put into it
+        for change in response.get('changes', []):
+            file = change.get('file')
+            if not file or not folder_ids.intersection(file.get('parents', [])):
+                continue
+            if file.get('mimeType') == FOLDER_MIME_TYPE:
+                if track_subfolders and not file.get('trashed'):
+                    folder_ids.add(file['id'])
+            elif matches_criteria(file):
+                files.append(file)
+
+        page_token = response.get('nextPageToken')
+        if page_token is None:
+            return files, response['newStartPageToken']
 
 def search_files(folder_id=None, recursive=False):
     """
@@ -123,14 +369,15 @@ def get_subfolders(folder_id):
     
     while True:
         try:
-            response = service.files().list(
+            response = _execute_with_backoff(service.files().list(
                 q=query,
                 spaces='drive',
                 fields='nextPageToken, files(id, name)',
                 pageToken=page_token,
+                pageSize=PAGE_SIZE,
                 supportsAllDrives=True,
                 includeItemsFromAllDrives=True
-            ).execute()
+            ))
             
             files = response.get('files', [])
             results.extend(files)
@@ -138,7 +385,7 @@ def get_subfolders(folder_id):
             page_token = response.get('nextPageToken', None)
             if page_token is None:
                 break
-        except Exception as e:
+        except HttpError as e:
             print(f"Error getting subfolders: {e}")
             break
             
@@ -155,14 +402,15 @@ def list_files_in_folder(folder_id):
     
     while True:
         try:
-            response = service.files().list(
+            response = _execute_with_backoff(service.files().list(
                 q=query,
                 spaces='drive',
                 fields='nextPageToken, files(id, name, webViewLink, mimeType)',
                 pageToken=page_token,
+                pageSize=PAGE_SIZE,
                 supportsAllDrives=True,
                 includeItemsFromAllDrives=True
-            ).execute()
+            ))
             
             files = response.get('files', [])
             results.extend(files)
@@ -170,31 +418,39 @@ def list_files_in_folder(folder_id):
             page_token = response.get('nextPageToken', None)
             if page_token is None:
                 break
-        except Exception as e:
+        except HttpError as e:
             print(f"Error listing files: {e}")
             break
             
     return results
 
-def download_file(file_id, destination_path):
-    """Downloads a file from Google Drive to the specified path."""
-    from googleapiclient.http import MediaIoBaseDownload
-    import io
-
+def download_file(file_id, destination):
+    """
+    Downloads a file from Google Drive.
+    destination is either a path or a writable binary file-like object;
+    chunks are streamed straight into it.
+    """
     service = get_drive_service()
     request = service.files().get_media(fileId=file_id)
     
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
+    if isinstance(destination, str):
+        with open(destination, 'wb') as fh:
+            _stream_download(MediaIoBaseDownload(fh, request, chunksize=DOWNLOAD_CHUNK_SIZE))
+    else:
+        _stream_download(MediaIoBaseDownload(destination, request, chunksize=DOWNLOAD_CHUNK_SIZE))
+    
+    return destination
+
+def download_bytes(file_id):
+    """Downloads a file from Google Drive straight into memory and returns its bytes."""
+    buffer = io.BytesIO()
+    download_file(file_id, buffer)
+    return buffer.getvalue()
+
+def _stream_download(downloader):
     done = False
     while done is False:
         status, done = downloader.next_chunk()
-    
-    # Write to file
-    with open(destination_path, 'wb') as f:
-        f.write(fh.getvalue())
-    
-    return destination_path
 
 if __name__ == '__main__':
     try:
@@ -1,15 +1,80 @@
 import pdfplumber
 import pytesseract
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 import pandas as pd
+import atexit
+import diskcache
+import hashlib
+import io
+import os
 import re
 import logging
-from pdf2image import convert_from_path
-from pdf2image import convert_from_path
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pdf2image import convert_from_path, convert_from_bytes
 from src.utils import normalize_date, expand_serial_ranges, clean_serial_number
 
+try:
+    import ahocorasick
+except ImportError:  # optional: single-pass multi-keyword matching
+    ahocorasick = None
+
+try:
+    import tesserocr
+except ImportError:  # optional: in-process Tesseract instead of a subprocess per page
+    tesserocr = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Pages of one document rendered/OCR'd at the same time. Every pytesseract call runs its own
+# tesseract process, so threads are enough to keep several cores busy
+OCR_THREADS = int(os.getenv("OCR_THREADS", min(4, os.cpu_count() or 1)))
+# Render resolution for OCR. Tesseract's time grows with pixel count; 200 DPI grayscale is
+# plenty for printed certificates (150 works for clean text-only scans)
+OCR_DPI = int(os.getenv("OCR_DPI", 200))
+
+def init_extraction_worker():
+    """
+    Initializer for extraction worker processes: one core per tesseract process, since
+    the pool already runs documents (and their pages) side by side. Only set there, so
+    OCR in a lone process keeps Tesseract's own multithreading. (In-process tesserocr
+    reads OpenMP settings when it loads; export OMP_THREAD_LIMIT to limit it too.)
+    """
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# Content-addressed cache of extract_data results (shared with the Gemini cache directory).
+# Bump CACHE_VERSION when the extraction logic changes so stale results aren't served.
+CACHE_TTL = 30 * 86400
+CACHE_VERSION = 4
+# Opened on first use, so COCQ_CACHE_DIR can still be changed after import (e.g. by tests)
+_cache = None
+_cache_lock = threading.Lock()
+
+def _get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = diskcache.Cache(os.path.expanduser(os.getenv("COCQ_CACHE_DIR", "~/.cocq_cache")))
+        return _cache
+
+def keyword_matcher(keywords):
+    """
+    Returns a function telling whether a lowercased string contains any of keywords
+    (case-insensitive substring match). Uses one Aho-Corasick automaton when
+    pyahocorasick is installed, otherwise checks the keywords one by one.
+    """
+    words = frozenset(k.lower() for k in keywords)
+    if ahocorasick is None:
+        return lambda text: any(w in text for w in words)
+    automaton = ahocorasick.Automaton()
+    for w in words:
+        automaton.add_word(w, w)
+    automaton.make_automaton()
+    return lambda text: next(automaton.iter(text), None) is not None
+
 def has_images(file_path):
     """Checks if a PDF contains images on the first page."""
     try:
@@ -34,6 +99,44 @@ def extract_text_from_pdf(file_path):
         logging.error(f"Error extracting PDF text: {e}")
         return None
 
+def pdf_to_images(file_path):
+    """Renders PDF pages to grayscale PIL images from a path or a binary file-like object."""
+    options = dict(dpi=OCR_DPI, grayscale=True, thread_count=OCR_THREADS)
+    if isinstance(file_path, str):
+        return convert_from_path(file_path, **options)
+    file_path.seek(0)
+    return convert_from_bytes(file_path.read(), **options)
+
+# Idle tesserocr engines, reused across pages and documents whichever thread runs them.
+# An engine is not safe to share, so each page checks one out; all are closed at exit
+_tess_engines = []
+_tess_lock = threading.Lock()
+
+def _close_tess_engines():
+    with _tess_lock:
+        while _tess_engines:
+            _tess_engines.pop().End()
+
+atexit.register(_close_tess_engines)
+
+def ocr_image(image):
+    """
+    OCRs one page image. Uses a pooled, persistent tesserocr engine when tesserocr is
+    installed (no process spawn or model load per page), else pytesseract.
+    """
+    if tesserocr is None:
+        return pytesseract.image_to_string(image)
+    with _tess_lock:
+        api = _tess_engines.pop() if _tess_engines else None
+    if api is None:
+        api = tesserocr.PyTessBaseAPI()
+    try:
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    finally:
+        with _tess_lock:
+            _tess_engines.append(api)
+
 def extract_text_with_ocr(file_path):
     """
     Converts PDF to images and uses Tesseract OCR to extract text.
@@ -42,122 +145,171 @@ def extract_text_with_ocr(file_path):
     logging.info(f"Running Tesseract OCR on {file_path}...")
     try:
         # Convert PDF pages to images
-        images = convert_from_path(file_path)
-        full_text = ""
-        for i, image in enumerate(images):
-            text = pytesseract.image_to_string(image)
-            full_text += f"\n--- Page {i+1} ---\n{text}"
-        return full_text
+        images = pdf_to_images(file_path)
+        if len(images) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(images), OCR_THREADS)) as pool:
+                texts = list(pool.map(ocr_image, images))
+        else:
+            texts = [ocr_image(image) for image in images]
+        return "".join(f"\n--- Page {i+1} ---\n{text}" for i, text in enumerate(texts))
     except Exception as e:
         logging.error(f"Tesseract OCR failed: {e}. Ensure 'tesseract' and 'poppler' are installed on your system.")
         return None
 
+# --- Date patterns (compiled once at import) ---
+_DATE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'\b\d{1,2}/\d{1,2}/\d{4}\b',
+    r'\b\d{4}-\d{2}-\d{2}\b',
+    # Support dots and spaces: 12.05.2023, 2023.05.12, 12 05 2023
+    r'\b\d{1,2}[. ]\d{1,2}[. ]\d{4}\b',
+    r'\b\d{4}[. ]\d{1,2}[. ]\d{1,2}\b',
+    # Month formats - strictly relax spacing around comma
+    r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{1,2},?\s*\d{4}\b',
+    r'\b\d{1,2} (?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{4}\b',
+)]
+_COMMA_DIGIT_RE = re.compile(r',(\d)')
+# Captures "Date: 12 Oct 2023" or "Date: 12/10/2023" even if slightly malformed
+_CONTEXT_DATE_RE = re.compile(r'(?:Date|Dated|Issue Date)[:\.\s]*([A-Za-z0-9\/\.\-, ]{8,20})', re.IGNORECASE)
+_DATE_JUNK_RE = re.compile(r'[^\w\/\.\-, ]')
+_DIGIT_RE = re.compile(r'\d')
+
+# --- Serial number patterns ---
+# Stricter keywords to avoid noise like No. 28A (addresses)
+_SN_KEYWORDS = sorted([
+    "Ref No.", "Ref No", "Certificate No.", "Certificate No",
+    "Serial Number", "Seri Number", "Serial No.", "Serial N0", "Serial No", "Serial",
+    "Ser.Nos.", "Ser.Nos", "Ser.No.", "Ser.No", "Ser. Nos.", "Ser. Nos", "Ser Nos",
+    "S/N", "S.N", "SN", "No:", "No."
+], key=len, reverse=True)
+_SN_KEYWORD_ALT = '|'.join(map(re.escape, _SN_KEYWORDS))
+# 1. Direct same-line match; allows comma, tilde, slash, underscore, dot and spaces around them
+_SAMELINE_RE = re.compile(
+    r'\b(?P<label>' + _SN_KEYWORD_ALT + r')(?![A-Za-z0-9])'
+    r'[:\.\t \-]*([A-Za-z0-9]+(?:\s*[-~/._,]\s*[A-Za-z0-9]+)*)',
+    re.IGNORECASE
+)
+# 2. Label on its own line, values in the lines below (vertical/columnar layout)
+_LABEL_ONLY_RE = re.compile(r'\b(' + _SN_KEYWORD_ALT + r')\b', re.IGNORECASE)
+# Alphanumeric, length 5+, often with delimiters. No comma here so comma-separated values
+# on one line stay distinct, but spaces around separators are allowed
+_SN_LINE_RE = re.compile(r'\b([A-Z0-9]{5,}(?:\s*[-~/._]\s*[A-Za-z0-9]+)*)\b')
+_WWW_TAIL_RE = re.compile(r'\s+www\b.*$', re.IGNORECASE)
+_HTTP_TAIL_RE = re.compile(r'\s+http.*$', re.IGNORECASE)
+_TRAILING_WWW_RE = re.compile(r'\s+www$', re.IGNORECASE)
+_TRAILING_PUNCT_RE = re.compile(r'[.\s]+$')
+# Typical delimiters: comma, semicolon, newline, or multi-space
+_SN_SPLIT_RE = re.compile(r'[,;\n]|\s{2,}')
+# Common Tesseract misreads inside serial numbers: letter O for zero, a lone space inside a digit run
+_OCR_O_ZERO_RE = re.compile(r'(?<=[A-Z0-9])O(?=\d)')
+# Digit runs separated by single spaces; see _join_digit_gaps for which gaps are joined
+_OCR_DIGIT_GAP_RE = re.compile(r'(?<!\d)\d+(?: \d+)+(?!\d)')
+# Digit runs this long are whole serials (the _SN_LINE_RE minimum), not fragments of one
+_SN_MIN_DIGITS = 5
+_WHITESPACE_RE = re.compile(r'\s+')
+# Lines after a label the vertical scan in extract_serial_number looks at
+_SN_SCAN_LINES = 10
+
+_CONTEXT_NOUNS = ["Tube", "Anode", "Inverter", "Generator", "Tank", "Detector"]
+_CONTEXT_NOUN_RES = [(noun, re.compile(r'\b' + re.escape(noun) + r'\b', re.IGNORECASE)) for noun in _CONTEXT_NOUNS]
+_NOISE_KEYWORDS = [
+    # Address terms
+    "Lane", "Street", "Ward", "District", "Hanoi", "Vietnam",
+    # Quantity/measurement terms
+    "pcs", "pes", "Quantity", "Invoice", "EA",
+    # Common company/manufacturer names
+    "MORITA", "Morita", "MFG", "CORP", "Corporation", "Company", "Ltd", "Limited",
+    "Inc", "Incorporated", "Japan", "JAPAN", "USA", "China",
+    # Common document terms
+    "Model", "Production", "Year", "Kyoto", "Osaka", "Tokyo",
+    # Common extracted noise words
+    "and", "the", "with", "made", "in", "dated", "kind", "type", "ref", "certificate", "city", "date"
+]
+_has_noise_keyword = keyword_matcher(_NOISE_KEYWORDS)
+_FRACTION_RANGE_RE = re.compile(r'^\d+/\d+ - \d+/\d+$')
+_FRACTION_RE = re.compile(r'^\d+/\d+$')
+_SHORT_REF_RE = re.compile(r'^[A-Z]{2,4}\d{1,3}$')
+_ALL_CAPS_WORD_RE = re.compile(r'^[A-Z]{3,}$')
+_PHONE_RE = re.compile(r'^\+?\d{1,3}[\s\-\.]?\(?\d{1,4}\)?[\s\-\.]?\d{3,4}[\s\-\.]?\d{3,4}$')
+
 def extract_date(text):
     """Extracts and normalizes dates from text."""
     if not text: return None
-    patterns = [
-        r'\b\d{1,2}/\d{1,2}/\d{4}\b', 
-        r'\b\d{4}-\d{2}-\d{2}\b', 
-        # Support dots and spaces: 12.05.2023, 2023.05.12, 12 05 2023
-        r'\b\d{1,2}[. ]\d{1,2}[. ]\d{4}\b',
-        r'\b\d{4}[. ]\d{1,2}[. ]\d{1,2}\b',
-        # Month formats - strictly relax spacing around comma
-        r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{1,2},?\s*\d{4}\b',
-        r'\b\d{1,2} (?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{4}\b'
-    ]
     
     # 1. Try stand-alone date patterns
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(text)
         if match:
             date_str = match.group(0)
             # Fix missing space after comma (July 12,2021 -> July 12, 2021)
-            date_str = re.sub(r',(\d)', r', \1', date_str)
+            date_str = _COMMA_DIGIT_RE.sub(r', \1', date_str)
             return normalize_date(date_str)
             
     # 2. Try context-based extraction (Date: ...)
-    # Captures "Date: 12 Oct 2023" or "Date: 12/10/2023" even if slightly malformed
-    context_pattern = r'(?:Date|Dated|Issue Date)[:\.\s]*([A-Za-z0-9\/\.\-, ]{8,20})'
-    match = re.search(context_pattern, text, re.IGNORECASE)
+    match = _CONTEXT_DATE_RE.search(text)
     if match:
         potential_date = match.group(1).strip()
         # Clean up potential trail characters
-        potential_date = re.sub(r'[^\w\/\.\-, ]', '', potential_date)
+        potential_date = _DATE_JUNK_RE.sub('', potential_date)
         # Try to normalize this string
         normalized = normalize_date(potential_date)
         # Verify it looks like a date (roughly)
-        if re.search(r'\d', normalized): 
+        if _DIGIT_RE.search(normalized): 
             return normalized
 
     return None
 
+@lru_cache(maxsize=4096)
+def is_noise(val):
+    """True if a serial-number candidate looks like an address, company name, phone number, etc."""
+    val_lower = val.lower()
+    # Exclude common noise
+    if _has_noise_keyword(val_lower):
+        return True
+    # Exclude simple fractions like 1/3
+    if _FRACTION_RANGE_RE.match(val) or _FRACTION_RE.match(val):
+        return True
+    # Exclude short reference codes like ANH25, CO25, CQ25 (likely document IDs)
+    if _SHORT_REF_RE.match(val):
+        return True
+    # Exclude all-caps single words (likely company names/logos)
+    if _ALL_CAPS_WORD_RE.match(val):
+        return True
+    # Exclude phone numbers and fax patterns
+    if _PHONE_RE.match(val):
+        return True
+    # Exclude website patterns
+    if 'www.' in val_lower or '.com' in val_lower or '.co.jp' in val_lower:
+        return True
+    return False
+
+def _serial_key(value):
+    """Dedup key for a serial: "ABC - 123", "abc-123" and "ABC-123" are the same serial."""
+    return _WHITESPACE_RE.sub('', value).upper()
+
+def _dedup_serials(values):
+    """Drops serials whose _serial_key was already seen, keeping the first spelling and the order."""
+    first = {}
+    for value in values:
+        first.setdefault(_serial_key(value), value)
+    return list(first.values())
+
 def extract_serial_number(text):
     """Extracts serial numbers based on keywords, handling multi-line/columnar data."""
     if not text: return []
     
-    # Stricter keywords to avoid noise like No. 28A (addresses)
-    keywords = [
-        "Ref No.", "Ref No", "Certificate No.", "Certificate No", 
-        "Serial Number", "Seri Number", "Serial No.", "Serial N0", "Serial No", "Serial", 
-        "Ser.Nos.", "Ser.Nos", "Ser.No.", "Ser.No", "Ser. Nos.", "Ser. Nos", "Ser Nos",
-        "S/N", "S.N", "SN", "No:", "No."
-    ]
-    keywords.sort(key=len, reverse=True)
-    
-    # 1. Direct same-line match
-    keyword_pat = r'\b(?P<label>' + '|'.join(map(re.escape, keywords)) + r')(?![A-Za-z0-9])'
-    # Updated pattern: allow comma, tilde, slash, underscore, dot and spaces around them
-    sameline_pattern = keyword_pat + r'[:\.\t \-]*([A-Za-z0-9]+(?:\s*[-~/._,]\s*[A-Za-z0-9]+)*)'
-    
     results = []
     seen = set()
-    context_nouns = ["Tube", "Anode", "Inverter", "Generator", "Tank", "Detector"]
-    noise_keywords = [
-        # Address terms
-        "Lane", "Street", "Ward", "District", "Hanoi", "Vietnam",
-        # Quantity/measurement terms
-        "pcs", "pes", "Quantity", "Invoice", "EA",
-        # Common company/manufacturer names
-        "MORITA", "Morita", "MFG", "CORP", "Corporation", "Company", "Ltd", "Limited",
-        "Inc", "Incorporated", "Japan", "JAPAN", "USA", "China",
-        # Common document terms
-        "Model", "Production", "Year", "Kyoto", "Osaka", "Tokyo",
-        # Common extracted noise words
-        "and", "the", "with", "made", "in", "dated", "kind", "type", "ref", "certificate", "city", "date"
-    ]
-
-    def is_noise(val):
-        # Exclude common noise
-        if any(nk.lower() in val.lower() for nk in noise_keywords):
-            return True
-        # Exclude simple fractions like 1/3
-        if re.match(r'^\d+/\d+ - \d+/\d+$', val) or re.match(r'^\d+/\d+$', val):
-            return True
-        # Exclude short reference codes like ANH25, CO25, CQ25 (likely document IDs)
-        if re.match(r'^[A-Z]{2,4}\d{1,3}$', val):
-            return True
-        # Exclude all-caps single words (likely company names/logos)
-        if re.match(r'^[A-Z]{3,}$', val):
-            return True
-        # Exclude phone numbers and fax patterns
-        if re.match(r'^\+?\d{1,3}[\s\-\.]?\(?\d{1,4}\)?[\s\-\.]?\d{3,4}[\s\-\.]?\d{3,4}$', val):
-            return True
-        # Exclude website patterns
-        if 'www.' in val.lower() or '.com' in val.lower() or '.co.jp' in val.lower():
-            return True
-        return False
 
     # First pass: Same line matches
-    for match in re.finditer(sameline_pattern, text, re.IGNORECASE):
+    for match in _SAMELINE_RE.finditer(text):
         raw_val = match.group(2).strip()
         if raw_val.lower() == "number": continue
         
         # Remove website suffixes that might be attached (e.g., "SERIAL123 www")
-        raw_val = re.sub(r'\s+www\b.*$', '', raw_val, flags=re.IGNORECASE)
-        raw_val = re.sub(r'\s+http.*$', '', raw_val, flags=re.IGNORECASE)
+        raw_val = _WWW_TAIL_RE.sub('', raw_val)
+        raw_val = _HTTP_TAIL_RE.sub('', raw_val)
         
-        # Split by typical delimiters (comma, semicolon, newline, or multi-space)
-        parts = re.split(r'[,;\n]|\s{2,}', raw_val)
+        parts = _SN_SPLIT_RE.split(raw_val)
         
         for val in parts:
             val = val.strip()
@@ -165,8 +317,8 @@ def extract_serial_number(text):
                 continue
             
             # Additional cleanup: remove trailing punctuations and www
-            val = re.sub(r'[.\s]+$', '', val)
-            val = re.sub(r'\s+www$', '', val, flags=re.IGNORECASE)
+            val = _TRAILING_PUNCT_RE.sub('', val)
+            val = _TRAILING_WWW_RE.sub('', val)
             
             # Check if it's noise AFTER cleanup
             if is_noise(val):
@@ -179,104 +331,272 @@ def extract_serial_number(text):
             if line_start != -1: preceding_text = preceding_text[line_start+1:]
             
             found_noun = None
-            for noun in context_nouns:
-                if re.search(r'\b' + re.escape(noun) + r'\b', preceding_text, re.IGNORECASE):
+            for noun, noun_re in _CONTEXT_NOUN_RES:
+                if noun_re.search(preceding_text):
                     found_noun = noun
                     break
             
             formatted_val = f"{val} ({found_noun})" if found_noun else val
-            if formatted_val not in seen:
+            key = _serial_key(formatted_val)
+            if key not in seen:
                 results.append(formatted_val)
-                seen.add(formatted_val)
+                seen.add(key)
+
+    # Second pass: Vertical/Columnar scan of the lines below each label.
+    # Labels are located with one regex sweep over the whole text (a label never spans a line
+    # break), and overlapping windows are merged so every line is scanned once, in order.
+    label_lines = []
+    line_no, pos = 0, 0
+    for label in _LABEL_ONLY_RE.finditer(text):
+        line_no += text.count('\n', pos, label.start())
+        pos = label.start()
+        if not label_lines or label_lines[-1] != line_no:
+            label_lines.append(line_no)
+    if not label_lines:
+        return results
 
-    # Second pass: Vertical/Columnar scan
-    label_only_pat = r'\b(' + '|'.join(map(re.escape, keywords)) + r')\b'
     lines = text.split('\n')
-    for i, line in enumerate(lines):
-        if re.search(label_only_pat, line, re.IGNORECASE):
-            start_scan = i + 1
-            end_scan = min(len(lines), i + 10)  # Increased to capture more serial numbers
-            for j in range(start_scan, end_scan):
-                # Pattern: Alphanumeric, length 5+, often with delimiters. 
-                # Note: Do not include comma here to allow comma-separated values to be distinct if on one line
-                # But allow spaces around separators
-                sn_pattern = r'\b([A-Z0-9]{5,}(?:\s*[-~/._]\s*[A-Za-z0-9]+)*)\b'
-                line_matches = re.finditer(sn_pattern, lines[j])
-                for sn_match in line_matches:
-                    val = sn_match.group(1).strip()
-                    # Remove www suffix if attached
-                    val = re.sub(r'\s+www$', '', val, flags=re.IGNORECASE)
-                    if val not in seen and not is_noise(val):
-                        results.append(val)
-                        seen.add(val)
+    scan_from = 0
+    for i in label_lines:
+        end_scan = min(len(lines), i + _SN_SCAN_LINES)  # Increased to capture more serial numbers
+        for j in range(max(i + 1, scan_from), end_scan):
+            for sn_match in _SN_LINE_RE.finditer(lines[j]):
+                val = sn_match.group(1).strip()
+                # Remove www suffix if attached
+                val = _TRAILING_WWW_RE.sub('', val)
+                key = _serial_key(val)
+                if key not in seen and not is_noise(val):
+                    results.append(val)
+                    seen.add(key)
+        scan_from = max(scan_from, end_scan)
 
     return results
 
+def _join_digit_gaps(match):
+    """
+    Rejoins 'a b' digit runs split by a stray OCR space ("2194 907" -> "2194907"), but only
+    when one side is shorter than a serial: "12345 67890" is a list of two serials and stays.
+    """
+    parts = match.group().split(' ')
+    joined = [parts[0]]
+    for part in parts[1:]:
+        if len(joined[-1]) < _SN_MIN_DIGITS or len(part) < _SN_MIN_DIGITS:
+            joined[-1] += part
+        else:
+            joined.append(part)
+    return ' '.join(joined)
+
+def _ocr_cleanup(text):
+    """
+    Repairs typical OCR damage to serial numbers ("SN1O23" -> "SN1023", "2194 907" -> "2194907")
+    on serial label lines and the lines scanned below them. Other lines (dates, addresses) are kept as-is.
+    """
+    lines = text.split('\n')
+    end = 0
+    for i, line in enumerate(lines):
+        if _LABEL_ONLY_RE.search(line):
+            end = i + _SN_SCAN_LINES
+        if i < end:
+            lines[i] = _OCR_DIGIT_GAP_RE.sub(_join_digit_gaps, _OCR_O_ZERO_RE.sub('0', line))
+    return '\n'.join(lines)
+
+# Table header keywords and values to skip in a serial-number column
+_is_table_date_header = keyword_matcher(["Date", "Issue Date", "Dated"])
+_is_table_sn_header = keyword_matcher(["Serial Number", "Serial No.", "Seri Number", "Seri"]) # Added Seri
+_is_table_noise = keyword_matcher(['product type', 'type', 'product', 'power', 'mac', 'window'])
+
+def _consume_table(table, extracted_data):
+    """Collects date/serial number values from one table into extracted_data."""
+    for i, row in enumerate(table):
+        # Clean row data
+        row_text = [str(cell).strip() if cell else "" for cell in row]
+
+        for col_idx, cell_text in enumerate(row_text):
+            cell_lower = cell_text.lower()
+
+            # Check for Serial Number Header
+            if _is_table_sn_header(cell_lower):
+                # Found SN header. Scan this column downwards.
+                found_sns = []
+                # Scan up to 15 rows down
+                for r_idx in range(i + 1, min(len(table), i + 15)):
+                    if len(table[r_idx]) > col_idx:
+                        val = str(table[r_idx][col_idx]).strip()
+                        val_lower = val.lower()
+                        if val and len(val) > 4:
+                            # Skip obvious non-serial headers/noise in the column
+                            if _is_table_noise(val_lower):
+                                continue
+                            found_sns.append(val)
+
+                if found_sns:
+                    if "serial_number" not in extracted_data:
+                        extracted_data["serial_number"] = []
+                    extracted_data["serial_number"].extend(found_sns)
+
+            # Check for Date Header
+            if _is_table_date_header(cell_lower):
+                # Horizontal finding first
+                if col_idx + 1 < len(row_text):
+                    val = row_text[col_idx + 1]
+                    if val: extracted_data["date"] = val
+                # If empty, check next row same col
+                if not extracted_data.get("date") and i + 1 < len(table):
+                    val = str(table[i+1][col_idx]).strip()
+                    if val: extracted_data["date"] = val
+
 def extract_from_tables(file_path):
     """Extracts key-value pairs from tables in the PDF."""
     extracted_data = {}
-    target_keywords = {
-        "date": ["Date", "Issue Date", "Dated"],
-        "serial_number": ["Serial Number", "Serial No.", "Seri Number", "Seri"] # Added Seri
-    }
-    
+
     try:
         with pdfplumber.open(file_path) as pdf:
             for page in pdf.pages:
-                tables = page.extract_tables()
-                for table in tables:
-                    for i, row in enumerate(table):
-                        # Clean row data
-                        row_text = [str(cell).strip() if cell else "" for cell in row]
-                        
-                        for col_idx, cell_text in enumerate(row_text):
-                            cell_lower = cell_text.lower()
-                            
-                            # Check for Serial Number Header
-                            if any(k.lower() in cell_lower for k in target_keywords["serial_number"]):
-                                # Found SN header. Scan this column downwards.
-                                found_sns = []
-                                # Scan up to 15 rows down
-                                for r_idx in range(i + 1, min(len(table), i + 15)):
-                                    if len(table[r_idx]) > col_idx:
-                                        val = str(table[r_idx][col_idx]).strip()
-                                        val_lower = val.lower()
-                                        if val and len(val) > 4:
-                                            # Skip obvious non-serial headers/noise in the column
-                                            noise_col_vals = ['product type', 'type', 'product', 'power', 'mac', 'window']
-                                            if any(n in val_lower for n in noise_col_vals):
-                                                continue
-                                            found_sns.append(val)
-                                
-                                if found_sns:
-                                    if "serial_number" not in extracted_data:
-                                        extracted_data["serial_number"] = []
-                                    extracted_data["serial_number"].extend(found_sns)
-
-                            # Check for Date Header
-                            if any(k.lower() in cell_lower for k in target_keywords["date"]):
-                                # Horizontal finding first
-                                if col_idx + 1 < len(row_text):
-                                    val = row_text[col_idx + 1]
-                                    if val: extracted_data["date"] = val
-                                # If empty, check next row same col
-                                if not extracted_data.get("date") and i + 1 < len(table):
-                                    val = str(table[i+1][col_idx]).strip()
-                                    if val: extracted_data["date"] = val
+                for table in page.extract_tables():
+                    _consume_table(table, extracted_data)
 
     except Exception as e:
         logging.error(f"Table extraction failed: {e}")
-        
+
     return extracted_data
 
+# A text layer shorter than this (stripped) means a scan with no real digital text
+_MIN_TEXT_CHARS = 10
+
+def _pdfium_probe(file_path):
+    """
+    Reads the text layer and first-page image flag with pdfium (native, much faster
+    than pdfminer). Returns (text, has_images), or None if pdfium can't open the file.
+    Stops reading pages once the text reaches _MIN_TEXT_CHARS, so for a digital PDF
+    the text is only a prefix; it is complete only when shorter than that.
+    """
+    try:
+        pdf = pdfium.PdfDocument(file_path)
+    except Exception:
+        return None
+    try:
+        parts = []
+        has_img = False
+        chars = 0
+        for i, page in enumerate(pdf):
+            if i == 0:
+                has_img = any(True for _ in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,), max_depth=1))
+            textpage = page.get_textpage()
+            parts.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+            # Never more than the stripped length of the joined text, so stopping is safe
+            chars += len(parts[-1].strip())
+            if chars >= _MIN_TEXT_CHARS:
+                break
+        return "\n".join(parts).replace("\r\n", "\n"), has_img
+    except Exception:
+        return None
+    finally:
+        pdf.close()
+        if not isinstance(file_path, str):
+            file_path.seek(0)
+
+def _digital_pass(file_path):
+    """
+    Returns (text, has_images, table_data), the combined results of
+    extract_text_from_pdf, has_images and extract_from_tables.
+    A PDF without a text layer (a scan) is recognised by a quick pdfium probe
+    and skips pdfplumber entirely, since it can't contain text tables either.
+    Otherwise the PDF is opened once with pdfplumber for text, images and tables.
+    """
+    probe = _pdfium_probe(file_path)
+    if probe is not None and len(probe[0].strip()) < _MIN_TEXT_CHARS:
+        return probe[0], probe[1], {}
+
+    text = ""
+    has_img = False
+    table_data = {}
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            try:
+                has_img = bool(pdf.pages and pdf.pages[0].images)
+            except Exception:
+                pass
+
+            text_ok = tables_ok = True
+            for page in pdf.pages:
+                if text_ok:
+                    try:
+                        extracted = page.extract_text()
+                        if extracted:
+                            text += extracted + "\n"
+                    except Exception as e:
+                        logging.error(f"Error extracting PDF text: {e}")
+                        text_ok = False
+                if tables_ok:
+                    try:
+                        for table in page.extract_tables():
+                            _consume_table(table, table_data)
+                    except Exception as e:
+                        logging.error(f"Table extraction failed: {e}")
+                        tables_ok = False
+            return (text if text_ok else None), has_img, table_data
+    except Exception as e:
+        logging.error(f"Error extracting PDF text: {e}")
+        return None, False, table_data
+
+def _content_key(file_path):
+    """Cache key from the SHA-256 of the PDF's bytes, or None if the file can't be read."""
+    digest = hashlib.sha256()
+    try:
+        if isinstance(file_path, str):
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        else:
+            file_path.seek(0)
+            for chunk in iter(lambda: file_path.read(1024 * 1024), b""):
+                digest.update(chunk)
+            file_path.seek(0)
+    except OSError:
+        return None
+    return f"extract:v{CACHE_VERSION}:{digest.hexdigest()}"
+
 def extract_data(file_path, force_ocr=False):
-    """Orchestrates the extraction process: Digital -> Table -> OCR."""
+    """
+    Orchestrates the extraction process: Digital -> Table -> OCR.
+    file_path may be a path or a seekable binary file-like object (e.g. a spooled temp file).
+    Successful results are cached on disk by file content; force_ocr always re-extracts
+    (and refreshes the cached result).
+    """
+    cache_key = _content_key(file_path)
+    if cache_key is not None and not force_ocr:
+        cached = _get_cache().get(cache_key)
+        if cached is not None:
+            logging.info(f"Using cached extraction result for {file_path}")
+            return cached
+
+    data, method, ocr_failed = _extract_data_uncached(file_path, force_ocr)
+    result = (data, method)
+    if cache_key is not None and not ocr_failed and _is_cacheable(result):
+        _get_cache().set(cache_key, result, expire=CACHE_TTL)
+    return result
+
+def _is_cacheable(result):
+    """
+    Only successful parses are cached: a failed OCR (missing tesseract/poppler, a transient
+    error) or an empty result is retried on the next scan instead of being served for CACHE_TTL.
+    """
+    data, method = result
+    return "(Failed)" not in method and bool(data.get("date") or data.get("serial_number"))
+
+def _extract_data_uncached(file_path, force_ocr):
+    """
+    Returns (data, method, ocr_failed). ocr_failed is True whenever OCR was needed but
+    produced no text, even if the method label doesn't say so (a partial digital result).
+    """
     method = "Regex"
+    ocr_failed = False
     
-    # 1. Digital Analysis
-    text = extract_text_from_pdf(file_path)
+    # 1. Digital Analysis (text, first-page images and tables from a single open)
+    text, has_img, table_data = _digital_pass(file_path)
     is_scanned = not text or len(text.strip()) < 10
-    has_img = has_images(file_path)
     
     # Digital Extraction
     data = {
@@ -285,7 +605,6 @@ def extract_data(file_path, force_ocr=False):
     }
     
     # Table Supplement
-    table_data = extract_from_tables(file_path)
     if table_data.get("date") and not data["date"]:
         data["date"] = extract_date(table_data["date"])
     if table_data.get("serial_number"):
@@ -293,9 +612,11 @@ def extract_data(file_path, force_ocr=False):
         for sn in table_data["serial_number"]:
             # Check if this SN is already in the list or is a substring of an existing one
             is_duplicate = False
+            sn_key = _serial_key(sn)
             for i, existing_sn in enumerate(data["serial_number"]):
-                # If new SN is substring of existing, or vice versa
-                if sn in existing_sn or existing_sn in sn:
+                # If new SN is substring of existing, or vice versa (ignoring case and spacing)
+                existing_key = _serial_key(existing_sn)
+                if sn_key in existing_key or existing_key in sn_key:
                     is_duplicate = True
                     # If existing is shorter (partial), replace it with the longer one
                     if len(sn) > len(existing_sn):
@@ -327,11 +648,11 @@ def extract_data(file_path, force_ocr=False):
             if ocr_date and (not data["date"] or is_scanned):
                 data["date"] = ocr_date
             
-            ocr_sns = extract_serial_number(ocr_text)
-            for sn in ocr_sns:
-                if sn not in data["serial_number"]:
-                    data["serial_number"].append(sn)
+            # Serial-specific repairs only; dates are read from the raw OCR text above
+            ocr_sns = extract_serial_number(_ocr_cleanup(ocr_text))
+            data["serial_number"] = _dedup_serials(data["serial_number"] + ocr_sns)
         else:
+            ocr_failed = True
             if is_scanned or force_ocr:
                 method = "OCR (Tesseract) (Failed)"
 
@@ -344,8 +665,12 @@ def extract_data(file_path, force_ocr=False):
         data["serial_number"] = expand_serial_ranges(cleaned_serials)
         
         if data["serial_number"]:
-            data["serial_number"] = "\n".join(list(dict.fromkeys(data["serial_number"])))
+            data["serial_number"] = "\n".join(_dedup_serials(data["serial_number"]))
         else:
             data["serial_number"] = None
             
-    return data, method
+    return data, method, ocr_failed
+
+def extract_data_bytes(pdf_bytes, force_ocr=False):
+    """Runs extract_data on an in-memory PDF (no temp file needed)."""
+    return extract_data(io.BytesIO(pdf_bytes), force_ocr=force_ocr)
@@ -0,0 +1,96 @@
+from src.utils import normalize_date, fuzzy_serial, fuzzy_serials
+
+try:
+    import ahocorasick
+except ImportError:  # optional: one pass over the sheet for many serial queries
+    ahocorasick = None
+
+def build_search_index(df):
+    """
+    Adds the helper columns filter_records searches on, computed once per sheet load:
+    the normalized date (and its uppercase form), the serial cell text, and the cell's
+    cleaned, range-expanded fuzzy serials (one per line).
+    """
+    if "Date" in df.columns:
+        normalized_date = df["Date"].map(normalize_date)
+    else:
+        normalized_date = ""
+    if "Serial Number" not in df.columns:
+        df = df.assign(**{"Serial Number": ""})
+    sn_text = df["Serial Number"].astype(str)
+    df = df.assign(Normalized_Date=normalized_date)
+    return df.assign(
+        # Uppercased once so the case-insensitive date match is a plain substring test
+        _date_upper=df["Normalized_Date"].str.upper(),
+        _SN_text=sn_text,
+        _SN_has_range=sn_text.str.contains("~", regex=False),
+        _SN_fuzzy=sn_text.map(lambda cell: "\n".join(fuzzy_serials(cell)) if isinstance(cell, str) else ""),
+    )
+
+def filter_records(df, serial_query="", date_query=""):
+    """
+    Returns the rows of an indexed DataFrame (see build_search_index) matching the queries.
+    The serial match is a vectorized is_serial_in_range: a plain hit in a cell without
+    ranges, or a hit on the pre-expanded fuzzy serials (ranges, multi-line cells, O/0).
+    """
+    if serial_query:
+        df = df[_serial_mask(df, serial_query)]
+
+    if date_query:
+        # Search by either raw query or normalized query against the pre-calculated normalized column
+        normalized_user_query = normalize_date(date_query)
+        df = df[
+            (df["_date_upper"].str.contains(date_query.upper(), na=False, regex=False)) |
+            (df["_date_upper"].str.contains(normalized_user_query.upper(), na=False, regex=False))
+        ]
+
+    return df
+
+def _serial_mask(df, serial_query):
+    return (
+        (df["_SN_text"].str.contains(serial_query, regex=False) & ~df["_SN_has_range"])
+        | df["_SN_fuzzy"].str.contains(fuzzy_serial(serial_query), regex=False)
+    )
+
+def _automaton(words):
+    """Aho-Corasick automaton mapping each word to the targets it stands for."""
+    automaton = ahocorasick.Automaton()
+    for word, targets in words.items():
+        automaton.add_word(word, targets)
+    automaton.make_automaton()
+    return automaton
+
+def search_serials_batch(targets, df):
+    """
+    Matches many serial queries against an indexed DataFrame at once.
+    Returns {target: [index labels of matching rows]}, with the same per-target result as
+    filter_records(df, serial_query=target). With pyahocorasick installed every row is
+    scanned once for all targets; otherwise each target is a vectorized scan.
+    """
+    targets = list(dict.fromkeys(t for t in targets if t))
+    matches = {t: [] for t in targets}
+    if not targets or df.empty:
+        return matches
+
+    if ahocorasick is None:
+        for t in targets:
+            matches[t] = df.index[_serial_mask(df, t)].tolist()
+        return matches
+
+    raw_words, fuzzy_words = {}, {}
+    for t in targets:
+        raw_words.setdefault(t, []).append(t)
+        fuzzy_words.setdefault(fuzzy_serial(t), []).append(t)
+    raw_automaton, fuzzy_automaton = _automaton(raw_words), _automaton(fuzzy_words)
+
+    for label, text, has_range, fuzzy in zip(df.index, df["_SN_text"], df["_SN_has_range"], df["_SN_fuzzy"]):
+        hits = set()
+        # Plain hits only count in cells without ranges, as in is_serial_in_range
+        if not has_range and isinstance(text, str):
+            for _, found in raw_automaton.iter(text):
+                hits.update(found)
+        for _, found in fuzzy_automaton.iter(fuzzy):
+            hits.update(found)
+        for t in hits:
+            matches[t].append(label)
+    return matches
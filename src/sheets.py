@@ -1,17 +1,52 @@
+import re
+import threading
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from src.auth import authenticate_google_drive
+from src.auth import get_credentials
+
+# Drive file IDs appear as /d/<id>/... or ?id=<id> depending on the link flavour
+_DRIVE_ID_RE = re.compile(r"/d/([a-zA-Z0-9_-]+)|[?&]id=([a-zA-Z0-9_-]+)")
+HEADERS = ["File Name", "Date", "Serial Number", "Drive Link", "Content Hash"]
+# Column the app writes Drive links to (see ensure_headers)
+DRIVE_LINK_RANGE = "D:D"
+# Column holding the file's Drive md5Checksum, so re-uploads/copies of a file are recognised
+CONTENT_HASH_RANGE = "E:E"
+# The columns written by ensure_headers / append_data_to_sheet
+SHEET_RANGE = "A:E"
+# Every column clear_sheet_data wipes, for sheets whose layout differs from HEADERS
+FULL_SHEET_RANGE = "A:Z"
+
+# Reused per thread so consecutive calls share one keep-alive connection instead of
+# a fresh TCP+TLS handshake each time (httplib2 connections aren't thread-safe)
+_local = threading.local()
 
 def get_sheets_service():
-    """Returns an authorized Sheets API service instance."""
-    creds = authenticate_google_drive()
-    return build('sheets', 'v4', credentials=creds)
+    """Returns an authorized Sheets API service instance for the current thread."""
+    service = getattr(_local, 'service', None)
+    if service is None:
+        # Credentials are shared; only the (non-thread-safe) HTTP client is per thread
+        http = AuthorizedHttp(get_credentials(), http=httplib2.Http())
+        # Builds from the discovery document bundled with google-api-python-client>=2.0 (its
+        # default), so there is no HTTP fetch per build and no discovery cache to consult
+        service = _local.service = build('sheets', 'v4', http=http, cache_discovery=False)
+    return service
+
+def column_letter(col_index):
+    """Converts a 0-based column index to its A1 letter(s): 0 -> 'A', 25 -> 'Z', 26 -> 'AA'."""
+    letters = ""
+    col_index += 1
+    while col_index:
+        col_index, rem = divmod(col_index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
 
 def ensure_headers(service, spreadsheet_id):
     """
     Checks if the first row has the correct headers. 
     If not (or empty), writes them.
     """
-    headers = ["File Name", "Date", "Serial Number", "Drive Link"]
+    headers = HEADERS
     
     # Read first row
     result = service.spreadsheets().values().get(
@@ -31,26 +66,38 @@ def ensure_headers(service, spreadsheet_id):
         ).execute()
         return True
     
+    # Sheets created before the Content Hash column only get the missing header cell
+    if values[0][:4] == headers[:4] and len(values[0]) < len(headers):
+        service.spreadsheets().values().update(
+            spreadsheetId=spreadsheet_id, range="E1",
+            valueInputOption="RAW", body={'values': [headers[4:]]}
+        ).execute()
+        return True
+
     # Optional: Validate headers match, but for now assuming if data exists headers are likely there
     return True
 
+def prepare_sheet(spreadsheet_id):
+    """Makes sure the sheet has its header row; call once before appending rows."""
+    return ensure_headers(get_sheets_service(), spreadsheet_id)
+
 def append_data_to_sheet(spreadsheet_id, data_rows):
     """
     Appends a list of rows to the sheet.
     data_rows: List of lists, where each inner list corresponds to a row.
+    Callers run ensure_headers once before their first append (see prepare_sheet).
     """
     service = get_sheets_service()
     
-    # Ensure headers exist
-    ensure_headers(service, spreadsheet_id)
-    
     body = {
         'values': data_rows
     }
     
+    # RAW: cells are stored as sent, without formula/date parsing (which would also turn
+    # serials like "00123" into numbers)
     result = service.spreadsheets().values().append(
         spreadsheetId=spreadsheet_id, range="A1",
-        valueInputOption="USER_ENTERED", body=body
+        valueInputOption="RAW", insertDataOption="INSERT_ROWS", body=body
     ).execute()
     
     return result.get('updates', {}).get('updatedCells')
@@ -58,23 +105,26 @@ def append_data_to_sheet(spreadsheet_id, data_rows):
 def get_sheet_data(spreadsheet_id):
     """
     Reads data from the spreadsheet and returns a list of dictionaries.
-    Assumes headers are: File Name, Date, Serial Number, Drive Link
+    Assumes headers are: File Name, Date, Serial Number, Drive Link, Content Hash
     """
     service = get_sheets_service()
     
-    # Read wider range to ensure we don't miss columns if the schema changed
+    # Only the app's own columns, as raw values (dates still come back as their display text)
     result = service.spreadsheets().values().get(
-        spreadsheetId=spreadsheet_id, range="A:Z"
+        spreadsheetId=spreadsheet_id, range=SHEET_RANGE,
+        valueRenderOption="UNFORMATTED_VALUE", dateTimeRenderOption="FORMATTED_STRING"
     ).execute()
     
     values = result.get('values', [])
     if not values or len(values) < 2:
         return []
         
-    headers = [h.strip() for h in values[0]]
+    headers = [str(h).strip() for h in values[0]]
     data = []
     
     for row in values[1:]:
+        # Unformatted numbers arrive as int/float; callers expect cell text
+        row = [cell if isinstance(cell, str) else str(cell) for cell in row]
         # Pad row if some cells are empty at the end
         row_padded = row + [""] * (len(headers) - len(row))
         item = {}
@@ -95,9 +145,10 @@ def clear_sheet_data(spreadsheet_id):
     """
     service = get_sheets_service()
     
-    # First, get the current range to know how many rows exist
+    # First, get the current range to know how many rows exist. All of the app's columns
+    # are read: a row can have an empty File Name (e.g. after a manual edit)
     result = service.spreadsheets().values().get(
-        spreadsheetId=spreadsheet_id, range="A:Z"
+        spreadsheetId=spreadsheet_id, range=SHEET_RANGE
     ).execute()
     
     values = result.get('values', [])
@@ -105,9 +156,9 @@ def clear_sheet_data(spreadsheet_id):
         # Only headers or empty, nothing to clear
         return 0
     
-    # Clear from row 2 onwards
+    # Clear from row 2 onwards, with no row bound so nothing below the counted rows survives
     num_rows = len(values)
-    clear_range = f"A2:Z{num_rows}"
+    clear_range = "A2:Z"
     
     service.spreadsheets().values().clear(
         spreadsheetId=spreadsheet_id,
@@ -120,7 +171,66 @@ def get_existing_drive_links(spreadsheet_id):
     """
     Returns a set of Drive Links that are already present in the sheet.
     This is used to prevent re-scanning/re-adding the same file.
+    Only the Drive Link column (D) is read; if the sheet's layout differs,
+    falls back to reading the whole sheet (A:Z) and finding the column by its header.
+    """
+    service = get_sheets_service()
+    result = service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=DRIVE_LINK_RANGE,
+        majorDimension="COLUMNS", valueRenderOption="UNFORMATTED_VALUE"
+    ).execute()
+
+    columns = result.get('values', [])
+    if not columns:
+        return set()
+    column = columns[0]
+    if str(column[0]).strip() != "Drive Link":
+        # Not get_sheet_data: that only reads SHEET_RANGE, and here the column may be anywhere
+        values = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=FULL_SHEET_RANGE,
+            valueRenderOption="UNFORMATTED_VALUE"
+        ).execute().get('values', [])
+        headers = [str(h).strip() for h in values[0]] if values else []
+        if "Drive Link" not in headers:
+            return set()
+        i = headers.index("Drive Link")
+        return {row[i] for row in values[1:] if len(row) > i and row[i]}
+    # Skip the header; filter out empty cells
+    return {link for link in column[1:] if link}
+
+def drive_file_id(link):
     """
-    data = get_sheet_data(spreadsheet_id)
-    # Return a set of links. Filter out empty ones.
-    return {item.get("Drive Link") for item in data if item.get("Drive Link")}
+    Extracts the Drive file ID from a webViewLink.
+    Links for the same file differ (/view vs /edit, ?usp=drivesdk), the ID does not.
+    Returns None if no ID can be found.
+    """
+    match = _DRIVE_ID_RE.search(link or "")
+    if not match:
+        return None
+    return match.group(1) or match.group(2)
+
+def get_existing_drive_ids(spreadsheet_id):
+    """
+    Returns a set of Drive file IDs for the links already present in the sheet.
+    Comparing IDs instead of raw links survives link-format drift.
+    """
+    ids = {drive_file_id(link) for link in get_existing_drive_links(spreadsheet_id)}
+    ids.discard(None)
+    return ids
+
+def get_existing_content_hashes(spreadsheet_id):
+    """
+    Returns the set of content hashes (Drive md5Checksum) already present in the sheet.
+    Only column E is read; sheets without a Content Hash header (older layouts) return
+    an empty set, so deduplication falls back to Drive links alone.
+    """
+    service = get_sheets_service()
+    result = service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=CONTENT_HASH_RANGE,
+        majorDimension="COLUMNS", valueRenderOption="UNFORMATTED_VALUE"
+    ).execute()
+
+    columns = result.get('values', [])
+    if not columns or str(columns[0][0]).strip() != "Content Hash":
+        return set()
+    return {str(value) for value in columns[0][1:] if value}
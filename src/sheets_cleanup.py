@@ -18,9 +18,10 @@ def cleanup_sheet():
     print(f"Reading data from sheet: {spreadsheet_id}")
     service = sheets.get_sheets_service()
     
-    # Get all values
+    # Get the app's columns
     result = service.spreadsheets().values().get(
-        spreadsheetId=spreadsheet_id, range="A:Z"
+        spreadsheetId=spreadsheet_id, range=sheets.SHEET_RANGE,
+        valueRenderOption="UNFORMATTED_VALUE", dateTimeRenderOption="FORMATTED_STRING"
     ).execute()
     
     values = result.get('values', [])
@@ -28,7 +29,7 @@ def cleanup_sheet():
         print("No data found or sheet is empty.")
         return
         
-    headers = [h.strip() for h in values[0]]
+    headers = [str(h).strip() for h in values[0]]
     if "Date" not in headers:
         print("Error: 'Date' column not found in headers.")
         return
@@ -36,7 +37,8 @@ def cleanup_sheet():
     date_col_index = headers.index("Date")
     print(f"Date column found at index {date_col_index}")
     
-    updated_count = 0
+    date_col = sheets.column_letter(date_col_index)
+    updates = []
     # Process each row (skipping headers)
     for i, row in enumerate(values[1:], start=2):
         if len(row) > date_col_index:
@@ -45,20 +47,16 @@ def cleanup_sheet():
             
             if old_date != new_date:
                 print(f"Updating Row {i}: {old_date} -> {new_date}")
+                updates.append({'range': f"{date_col}{i}", 'values': [[new_date]]}) # e.g. C2
+
+    # All changed cells go out in one request
+    if updates:
+        service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'valueInputOption': "RAW", 'data': updates}
+        ).execute()
                 
-                # Update cell directly
-                cell_range = f"{chr(65 + date_col_index)}{i}" # e.g. C2
-                body = {'values': [[new_date]]}
-                
-                service.spreadsheets().values().update(
-                    spreadsheetId=spreadsheet_id,
-                    range=cell_range,
-                    valueInputOption="RAW",
-                    body=body
-                ).execute()
-                updated_count += 1
-                
-    print(f"Done! Updated {updated_count} rows.")
+    print(f"Done! Updated {len(updates)} rows.")
 
 if __name__ == "__main__":
     cleanup_sheet()
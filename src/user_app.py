@@ -1,10 +1,9 @@
 import streamlit as st
-import pandas as pd
 import os
 from datetime import datetime
 from dotenv import load_dotenv
 from src import sheets
-from src.utils import normalize_date, is_serial_in_range
+from src.search import build_search_index, filter_records
 
 # Load environment variables
 load_dotenv()
@@ -21,6 +20,19 @@ if not spreadsheet_id:
     st.error("Application is not configured: GOOGLE_SHEET_ID missing in .env")
     st.stop()
 
+@st.cache_data(ttl=300)
+def load_records(spreadsheet_id):
+    """
+    Sheet rows as a DataFrame with the search helper columns precomputed,
+    cached so repeated searches don't re-fetch and re-normalize the sheet.
+    """
+    import pandas as pd  # deferred: only needed once a search actually runs
+
+    df = pd.DataFrame(sheets.get_sheet_data(spreadsheet_id))
+    if df.empty:
+        return df
+    return build_search_index(df)
+
 # Search UI
 col1, col2 = st.columns(2)
 
@@ -30,46 +42,21 @@ with col1:
 with col2:
     date_query = st.text_input("Date", placeholder="e.g. 12/05/2023").strip()
 
+if st.sidebar.button("Refresh data", help="Re-read the Google Sheet instead of using the cached copy"):
+    load_records.clear()
+
 if st.button("Search"):
     with st.spinner("Searching records..."):
         try:
-            # Fetch data from Google Sheets
-            all_data = sheets.get_sheet_data(spreadsheet_id)
+            # Fetch data from Google Sheets (cached)
+            df = load_records(spreadsheet_id)
             
-            if not all_data:
+            if df.empty:
                 st.info("No records found in the database.")
             else:
-                # Convert to DataFrame for easier filtering
-                df = pd.DataFrame(all_data)
-                
-                # Pre-calculate normalized date column once per fetch for faster searching
-                if "Date" in df.columns:
-                    df["Normalized_Date"] = df["Date"].apply(normalize_date)
-                else:
-                    df["Normalized_Date"] = ""
-
-                # Filtering logic
-                filtered_df = df.copy()
-                
-                if serial_query:
-                    # Match case-insensitive and handle multi-line serial cells, also check ranges
-                    # Use 'apply' to check each cell against specialized logic
-                    # We pass the serial_query to the lambda
-                    filtered_df = filtered_df[filtered_df["Serial Number"].apply(
-                        lambda cell: is_serial_in_range(serial_query, str(cell))
-                    )]
-                
-                if date_query:
-                    # Normalize user's query
-                    normalized_user_query = normalize_date(date_query)
-                    
-                    # Search by either raw query or normalized query against our pre-calculated normalized column
-                    filtered_df = filtered_df[
-                        (filtered_df["Normalized_Date"].str.contains(date_query, case=False, na=False)) |
-                        (filtered_df["Normalized_Date"].str.contains(normalized_user_query, case=False, na=False))
-                    ]
+                # Filtering logic (vectorized over the precomputed index columns)
+                filtered_df = filter_records(df, serial_query, date_query)
 
-                
                 if filtered_df.empty:
                     st.warning("No matches found for your search.")
                 else:
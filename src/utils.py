@@ -1,6 +1,86 @@
-from datetime import datetime
+import calendar
+import itertools
+from datetime import datetime, MINYEAR
+from functools import lru_cache
 import re
 
+# Potential formats to try, in order
+_DATE_FORMATS = (
+    '%d/%m/%Y', # Preferred
+    '%m/%d/%Y', 
+    '%Y-%m-%d', 
+    '%d-%m-%Y',
+    '%B %d, %Y', # January 01, 2026
+    '%b %d, %Y', # Jan 01, 2026
+    '%d/%m/%y',  # 01/01/26
+    '%Y/%m/%d',  # 2026/01/01 (common after dot normalization)
+    '%d-%b-%Y',  # 01-Jan-2026
+    '%B %d %Y',  # January 01 2026 (no comma)
+    '%b %d %Y',  # Jan 01 2026 (no comma)
+    '%d %B %Y',  # 01 January 2026
+    '%d %b %Y',  # 01 Jan 2026
+    '%d-%B-%Y',  # 01-January-2026
+)
+
+def _date_shape(text):
+    """Which of '/', '-', ',', whitespace and letters a date string (or a format's literal part) contains."""
+    return ('/' in text, '-' in text, ',' in text,
+            any(c.isspace() for c in text), any(c.isalpha() for c in text))
+
+def _formats_for_shape(shape):
+    """
+    The _DATE_FORMATS (in order) a string of this shape can possibly parse: the format's
+    '/', '-', ',' and month-name letters must match the string's exactly. A format's
+    space must be present, but extra whitespace is allowed (%d accepts ' 5').
+    """
+    slash, dash, comma, space, alpha = shape
+    formats = []
+    for fmt in _DATE_FORMATS:
+        f_slash, f_dash, f_comma, f_space, _ = _date_shape(re.sub('%[a-zA-Z]', '', fmt))
+        f_alpha = '%b' in fmt or '%B' in fmt
+        if (slash, dash, comma, alpha) == (f_slash, f_dash, f_comma, f_alpha) and (space or not f_space):
+            formats.append(fmt)
+    return tuple(formats)
+
+# Loose pattern per strptime directive; each accepts at least everything strptime does
+_DIRECTIVE_PATTERNS = {
+    '%d': r'\s?\d{1,2}', '%m': r'\s?\d{1,2}', '%Y': r'\d{4}', '%y': r'\d{2}',
+    '%b': r'[^\W\d_]+\.?', '%B': r'[^\W\d_]+\.?',
+}
+
+def _format_guard(fmt):
+    """
+    Regex that fullmatches every string strptime(fmt) can parse (and a few it can't), so
+    strings of the wrong shape skip the raise/catch of a failed strptime.
+    """
+    parts = re.split(r'(%[a-zA-Z]|\s+)', fmt)
+    return re.compile(''.join(
+        _DIRECTIVE_PATTERNS[part] if part in _DIRECTIVE_PATTERNS
+        else r'\s+' if part.isspace()
+        else re.escape(part)
+        for part in parts if part
+    ))
+
+# Shortlist of (format, guard) to try for every possible shape, so a miss retries 1-4 formats instead of 14
+_FORMATS_BY_SHAPE = {
+    shape: tuple((fmt, _format_guard(fmt)) for fmt in _formats_for_shape(shape))
+    for shape in itertools.product((False, True), repeat=5)
+}
+
+# The two most common shapes are parsed directly, without going through strptime
+_DMY_RE = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})')
+_ISO_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+_LOOSE_SEPARATORS_RE = re.compile(r'[.\s\-]')
+
+# Serial parsing patterns (compiled once at import)
+# Eats the whitespace on both sides of a delimiter, so split pieces come out stripped
+_SUB_ITEM_RE = re.compile(r'\s*[,;]\s*')
+_SPLIT_DB_RE = re.compile(r'[\n,;]')
+_KO_RE = re.compile(r'KO\d')
+_O_BEFORE_DIGIT_RE = re.compile(r'O(?=\d)')
+_O_AFTER_DIGIT_RE = re.compile(r'(?<=\d)O')
+_O_TO_0 = str.maketrans('O', '0')
+
 def normalize_date(d_str):
     """
     Standardizes date strings to DD/MM/YYYY.
@@ -8,42 +88,69 @@ def normalize_date(d_str):
     """
     if not d_str or not isinstance(d_str, str):
         return d_str
-    
+    return _normalize_date_str(d_str)
+
+@lru_cache(maxsize=8192)
+def _normalize_date_str(d_str):
     # Clean string
     d_str = d_str.strip()
-    
-    # Potential formats to try
-    formats = [
-        '%d/%m/%Y', # Preferred
-        '%m/%d/%Y', 
-        '%Y-%m-%d', 
-        '%d-%m-%Y',
-        '%B %d, %Y', # January 01, 2026
-        '%b %d, %Y', # Jan 01, 2026
-        '%d/%m/%y',  # 01/01/26
-        '%Y/%m/%d',  # 2026/01/01 (common after dot normalization)
-        '%d-%b-%Y',  # 01-Jan-2026
-        '%B %d %Y',  # January 01 2026 (no comma)
-        '%b %d %Y',  # Jan 01 2026 (no comma)
-        '%d %B %Y',  # 01 January 2026
-        '%d %b %Y',  # 01 Jan 2026
-        '%d-%B-%Y',  # 01-January-2026
-    ]
-    
-    for fmt in formats:
-        try:
-            return datetime.strptime(d_str, fmt).strftime('%d/%m/%Y')
-        except ValueError:
-            continue
-            
+    parsed = _parse_date(d_str)
+    if parsed:
+        return parsed
+
     # Try one more: loose separator check if everything above fails
     # e.g. "1.1.2026" or "01 01 2026"
-    cleaned = re.sub(r'[.\s\-]', '/', d_str)
+    cleaned = _LOOSE_SEPARATORS_RE.sub('/', d_str)
     if cleaned != d_str:
-        return normalize_date(cleaned) # Recursively try cleaned version
-        
+        return _parse_date(cleaned) or cleaned
+
     return d_str
 
+def _parse_date(d_str):
+    """Formats a stripped date string as DD/MM/YYYY, or returns None if no known format fits."""
+    match = _DMY_RE.fullmatch(d_str)
+    if match:
+        first, second, year = map(int, match.groups())
+        # DD/MM/YYYY preferred, MM/DD/YYYY if that isn't a valid date
+        for day, month in ((first, second), (second, first)):
+            if _is_valid_date(year, month, day):
+                return f"{day:02d}/{month:02d}/{year}"
+    else:
+        match = _ISO_RE.fullmatch(d_str)
+        if match:
+            year, month, day = map(int, match.groups())
+            if _is_valid_date(year, month, day):
+                return f"{day:02d}/{month:02d}/{year}"
+
+    for fmt, guard in _FORMATS_BY_SHAPE[_date_shape(d_str)]:
+        if not guard.fullmatch(d_str):
+            continue
+        try:
+            return datetime.strptime(d_str, fmt).strftime('%d/%m/%Y')
+        except ValueError:
+            continue
+    return None
+
+def _is_valid_date(year, month, day):
+    return year >= MINYEAR and 1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]
+
+def _split_trailing_digits(s):
+    """
+    Splits 'A5087' into ('A', '5087'); None if s doesn't end in a digit or the prefix
+    spans a line break (as with the former regex ^(.*?)(\\d+)$, whose '.' stops at a newline).
+    """
+    i = len(s)
+    # isdecimal() is the character class \d matches (isdigit() also accepts e.g. superscripts)
+    while i and s[i - 1].isdecimal():
+        i -= 1
+    if i == len(s) or '\n' in s[:i]:
+        return None
+    return s[:i], s[i:]
+
+def _emit_range(prefix, start, end, pad):
+    """Serials prefix+start .. prefix+end, numbers zero-padded to pad digits: ('A', 8, 10, 2) -> A08, A09, A10."""
+    return [prefix + str(i).zfill(pad) for i in range(start, end + 1)]
+
 def expand_serial_ranges(serial_list):
     """
     Expands serial numbers containing ranges (marked by '~' or '-').
@@ -58,8 +165,11 @@ def expand_serial_ranges(serial_list):
     'A100-A105' -> Expand (Similar)
     'A100 - B200' -> ['A100', 'B200'] (Dissimilar, split)
     'Model-X' -> ['Model-X'] (Not a range, looks like single entity)
+
+    Serials produced more than once (e.g. overlapping ranges) are returned once, in first-seen order.
     """
-    expanded = []
+    # Insertion-ordered set
+    expanded = {}
     if not serial_list:
         return []
         
@@ -69,10 +179,8 @@ def expand_serial_ranges(serial_list):
             
         # Pre-process: Split by clear delimiters first
         # We split by comma or semicolon
-        sub_items = re.split(r'[,;]\s*', item)
-        
-        for sub in sub_items:
-            sub = sub.strip()
+        # (item stripped once; the pattern strips around each delimiter)
+        for sub in _SUB_ITEM_RE.split(item.strip()):
             if not sub: continue
             
             # Decide on separator
@@ -85,7 +193,7 @@ def expand_serial_ranges(serial_list):
                 separator = '-'
             
             if not separator:
-                expanded.append(sub)
+                expanded[sub] = None
                 continue
                 
             # Split into potential parts
@@ -102,11 +210,11 @@ def expand_serial_ranges(serial_list):
                     parts = sub.split('-', 1)
                 else:
                     # Multiple hyphens or ambiguous? Treat as single unless clear
-                    expanded.append(sub)
+                    expanded[sub] = None
                     continue
 
             if len(parts) != 2:
-                expanded.append(sub)
+                expanded[sub] = None
                 continue
                 
             start_str = parts[0].strip()
@@ -115,20 +223,18 @@ def expand_serial_ranges(serial_list):
             # --- Range Expansion Logic ---
             
             # 1. Extract potential numbers
-            match_start = re.search(r'^(.*?)(\d+)$', start_str)
-            match_end = re.search(r'^(.*?)(\d+)$', end_str)
+            match_start = _split_trailing_digits(start_str)
+            match_end = _split_trailing_digits(end_str)
             
             is_range = False
             
             if match_start:
-                prefix = match_start.group(1)
-                start_num_str = match_start.group(2)
+                prefix, start_num_str = match_start
                 start_num = int(start_num_str)
                 
                 # Handling the End Part
                 if match_end:
-                    end_prefix = match_end.group(1)
-                    end_num_str = match_end.group(2)
+                    end_prefix, end_num_str = match_end
                     end_num = int(end_num_str)
                     
                     # SIMILARITY CHECKS
@@ -170,17 +276,13 @@ def expand_serial_ranges(serial_list):
 
             # EXECUTE EXPANSION OR SPLIT
             if is_range:
-                # Expand
-                for i in range(start_num, end_num + 1):
-                    # Use START's formatting
-                    # We try to preserve padding length of start
-                    fmt_num = str(i).zfill(len(start_num_str))
-                    expanded.append(f"{prefix}{fmt_num}")
+                # Expand, using START's formatting (we try to preserve padding length of start)
+                expanded.update(dict.fromkeys(_emit_range(prefix, start_num, end_num, len(start_num_str))))
             else:
                 # NOT a range.
                 if separator == '~':
                     # Tilde usually means range, if failed, keep as whole string?
-                    expanded.append(sub)
+                    expanded[sub] = None
                 else: 
                     # Hyphen: If not a range, treat as SEPARATE items if they look like separate entities
                     # e.g. "SerialA - SerialB"
@@ -188,13 +290,13 @@ def expand_serial_ranges(serial_list):
                     
                     # Heuristic: If both parts look like valid serials (alphanumeric length > 3), separate them
                     if len(start_str) > 3 and len(end_str) > 3:
-                         expanded.append(start_str)
-                         expanded.append(end_str)
+                         expanded[start_str] = None
+                         expanded[end_str] = None
                     else:
                          # Likely a single code (e.g. "AB-1")
-                         expanded.append(sub)
+                         expanded[sub] = None
 
-    return expanded
+    return list(expanded)
 
 def clean_serial_number(serial):
     """
@@ -206,7 +308,7 @@ def clean_serial_number(serial):
     if not serial: return serial
     
     # 1. Standard KO fix
-    if re.match(r'^KO\d+', serial):
+    if _KO_RE.match(serial):
         serial = 'K0' + serial[2:]
         
     # 2. Global O -> 0 Fix Check
@@ -217,10 +319,11 @@ def clean_serial_number(serial):
     # Risk: "ISO9001" -> "IS09001". Accepted risk? Perhaps. 
     # Safer: Swap O if it is surrounded by digits or creates a digit pattern.
     
-    if any(char.isdigit() for char in serial):
+    # The subs below only ever touch an 'O' next to a digit, so a plain 'O' check (one C-level
+    # scan) is enough to skip them; digit-free strings like "MODEL" are left alone by the subs
+    if 'O' in serial:
         # Allow O to become 0
         # Check against "all letters" again just in case
-        clean = serial.replace('O', '0')
         # But wait, what about "Model No 01"? "No" -> "N0". Bad.
         
         # Regex approach: Replace O only if followed/preceded by digit?
@@ -229,13 +332,35 @@ def clean_serial_number(serial):
         # But let's try to be smart: O sandwiched by digits?
         
         # Replace O with 0 if it is followed by a digit
-        serial = re.sub(r'O(?=\d)', '0', serial)
+        serial = _O_BEFORE_DIGIT_RE.sub('0', serial)
         # Replace O with 0 if it is preceded by a digit
-        serial = re.sub(r'(?<=\d)O', '0', serial)
+        serial = _O_AFTER_DIGIT_RE.sub('0', serial)
         
     return serial
 
 
+def fuzzy_serial(serial):
+    """
+    Reads every 'O' of a serial as '0', the form serial matching compares in.
+    Same as clean_serial_number(serial) with all O's swapped: its KO/O fixes only
+    ever turn O into 0, so one translate covers them.
+    """
+    return serial.translate(_O_TO_0)
+
+def fuzzy_serials(db_serial_string):
+    """
+    Expands a DB serial cell (newline/comma separated, possibly with ranges)
+    into its fuzzy_serial forms. Parse once and reuse when searching many times.
+    """
+    raw_list = _SPLIT_DB_RE.split(db_serial_string)
+    return [fuzzy_serial(item) for item in expand_serial_ranges(raw_list)]
+
+@lru_cache(maxsize=8192)
+def _prepared_fuzzy_serials(db_serial_string):
+    # Repeated is_serial_in_range calls on the same cell (one per query) parse it once.
+    # Items never contain a newline, so joined with one a per-item check becomes one C-level find.
+    return "\n".join(fuzzy_serials(db_serial_string))
+
 def is_serial_in_range(target_serial, db_serial_string):
     """
     Checks if 'target_serial' exists within 'db_serial_string', 
@@ -248,30 +373,15 @@ def is_serial_in_range(target_serial, db_serial_string):
     if target_serial in db_serial_string and '~' not in db_serial_string:
         return True
     
-    # If range exists or we want to be strict about boundaries, expand.
-    # Split DB string into list (it might be newline separated)
-    raw_list = re.split(r'[\n,;]', db_serial_string)
-    expanded_list = expand_serial_ranges(raw_list)
-    
-    # Clean target for comparison
-    clean_target = clean_serial_number(target_serial)
-    
-    # Normalize for fuzzy comparison (O vs 0)
+    # Fuzzy comparison (O vs 0) of cleaned values. A plain substring hit on the
+    # cleaned values is also a hit on their fuzzy forms, so only those are compared.
     # If explicit target is KO... we might want to match K0... 
     # But usually user types K0... and DB has K0 or KO.
-    target_fuzzy = clean_target.replace('O', '0')
-    
-    for item in expanded_list:
-        # Clean item from DB
-        clean_item = clean_serial_number(item)
-        item_fuzzy = clean_item.replace('O', '0')
-        
-        # Check standard substring
-        if clean_target in clean_item:
-            return True
-            
-        # Check fuzzy match
-        if target_fuzzy in item_fuzzy:
-            return True
-            
-    return False
+    target_fuzzy = fuzzy_serial(target_serial)
+    # Without '~' or '-' there is nothing to expand: the items are just the cell's separated
+    # pieces, so a target that can't straddle a separator or a stripped edge is found by one scan
+    if ('~' not in db_serial_string and '-' not in db_serial_string
+            and target_fuzzy == target_fuzzy.strip() and not _SPLIT_DB_RE.search(target_fuzzy)):
+        return target_fuzzy in db_serial_string.translate(_O_TO_0)
+    # A target with a newline can't be inside any single item
+    return '\n' not in target_fuzzy and target_fuzzy in _prepared_fuzzy_serials(db_serial_string)
@@ -7,7 +7,19 @@ environments.
 import os
 import sys
 
+import pytest
+
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path, monkeypatch):
+    """Points the on-disk result caches at a per-test directory instead of ~/.cocq_cache."""
+    monkeypatch.setenv("COCQ_CACHE_DIR", str(tmp_path / "cocq_cache"))
+    for name in ("src.extractor", "src.ai_extractor"):
+        module = sys.modules.get(name)
+        if module is not None:
+            monkeypatch.setattr(module, "_cache", None)
@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+
+from src import ai_extractor
+
+PDF = b"%PDF-1.4 minimal"
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+
+def _response(label):
+    response = MagicMock()
+    response.parsed.model_dump.return_value = {"date": None, "serial_number": [label]}
+    return response
+
+@patch("src.ai_extractor._request", side_effect=lambda pdf_data, client: {"contents": [pdf_data]})
+def test_extract_many_caps_concurrency_and_keeps_order(_):
+    in_flight = peak = 0
+
+    async def generate_content(contents):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        # Later inputs finish first
+        await asyncio.sleep(0.01 * (10 - contents[0][-1]))
+        in_flight -= 1
+        return _response(contents[0].decode())
+
+    client = MagicMock()
+    client.aio.models.generate_content = generate_content
+    # Distinct bytes so no call is answered from the result cache
+    pdfs = [(f"doc{i}.pdf", PDF + bytes([i])) for i in range(7)]
+
+    results = asyncio.run(ai_extractor.extract_many_with_gemini_async(pdfs, concurrency=3, client=client))
+
+    assert peak == 3
+    assert [r["serial_number"] for r in results] == [[pdf_data.decode()] for _, pdf_data in pdfs]
+
+def test_non_pdf_is_rejected_without_calling_the_client():
+    client = MagicMock()
+
+    assert ai_extractor.extract_with_gemini(pdf_data=b"<html>not a pdf</html>", client=client) is None
+    assert asyncio.run(ai_extractor.extract_with_gemini_async(b"PK\x03\x04 zip", client=client)) is None
+    client.models.generate_content.assert_not_called()
+
+def test_oversized_pdf_goes_through_the_file_api():
+    client = MagicMock()
+
+    with patch.object(ai_extractor, "MAX_INLINE_BYTES", len(PDF) - 1):
+        part = ai_extractor._pdf_part(PDF, client)
+
+    assert part is client.files.upload.return_value
+    _, kwargs = client.files.upload.call_args
+    assert kwargs["file"].getvalue() == PDF
+
+def _pdf_with_pages(count):
+    import io
+    import pypdfium2 as pdfium
+
+    doc = pdfium.PdfDocument.new()
+    for _ in range(count):
+        doc.new_page(595, 842)
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+def test_first_pages_trims_large_pdfs():
+    import pypdfium2 as pdfium
+
+    pdf_data = _pdf_with_pages(3)
+    with patch.object(ai_extractor, "TRIM_THRESHOLD", len(pdf_data) - 1):
+        trimmed = ai_extractor._first_pages(pdf_data)
+
+    assert len(pdfium.PdfDocument(trimmed)) == ai_extractor.MAX_PAGES == 2
+
+def test_first_pages_keeps_unparsable_bytes():
+    junk = b"%PDF-1.4 truncated" * 10
+    with patch.object(ai_extractor, "TRIM_THRESHOLD", 10):
+        assert ai_extractor._first_pages(junk) is junk
+
+@patch("src.ai_extractor._request", return_value={})
+def test_results_are_cached_by_content(_):
+    client = MagicMock()
+    client.models.generate_content.return_value = _response("SN1")
+
+    first = ai_extractor.extract_with_gemini(pdf_data=PDF, client=client)
+    assert ai_extractor.extract_with_gemini(pdf_data=PDF, client=client) == first
+    assert asyncio.run(ai_extractor.extract_with_gemini_async(PDF, client=client)) == first
+    client.models.generate_content.assert_called_once()
+
+@patch("src.ai_extractor._request", return_value={})
+def test_unusable_responses_are_not_cached(_):
+    client = MagicMock()
+    client.models.generate_content.return_value = None
+
+    assert ai_extractor.extract_with_gemini(pdf_data=PDF, client=client) is None
+    assert ai_extractor.extract_with_gemini(pdf_data=PDF, client=client) is None
+    assert client.models.generate_content.call_count == 2
+
+def _prompt_cache_error(error_cls, code, status):
+    client = MagicMock()
+    client.caches.create.side_effect = error_cls(code, {"error": {"code": code, "message": "nope", "status": status}})
+    return client
+
+def test_prompt_cache_rejection_disables_caching():
+    from google.genai import errors
+
+    client = _prompt_cache_error(errors.ClientError, 400, "INVALID_ARGUMENT")
+    state = {"name": None, "expires_at": 0.0, "retry_at": 0.0, "disabled": False}
+    with patch.object(ai_extractor, "_prompt_cache", state), \
+            patch("src.ai_extractor._get_client", return_value=client):
+        assert ai_extractor._cached_prompt_name() is None
+        assert ai_extractor._cached_prompt_name() is None
+
+    assert state["disabled"]
+    client.caches.create.assert_called_once()
+
+def test_prompt_cache_server_error_retries_later():
+    from google.genai import errors
+
+    client = _prompt_cache_error(errors.ServerError, 503, "UNAVAILABLE")
+    state = {"name": None, "expires_at": 0.0, "retry_at": 0.0, "disabled": False}
+    with patch.object(ai_extractor, "_prompt_cache", state), \
+            patch("src.ai_extractor._get_client", return_value=client), \
+            patch("src.ai_extractor.time.time", return_value=1000.0):
+        assert ai_extractor._cached_prompt_name() is None
+        # Inside the backoff window nothing is retried
+        assert ai_extractor._cached_prompt_name() is None
+
+    assert not state["disabled"]
+    assert state["retry_at"] == 1000.0 + ai_extractor.PROMPT_CACHE_RETRY
+    client.caches.create.assert_called_once()
@@ -29,6 +29,7 @@ def test_search_files(mock_get_service):
     query = kwargs.get('q', '')
     assert "name contains 'CO'" in query
     assert "name contains 'CQ'" in query
+    assert "name contains 'cocq'" not in query
     assert "application/pdf" in query
     assert "trashed = false" in query
 
@@ -44,3 +45,219 @@ def test_search_files_with_folder(mock_get_service):
     args, kwargs = mock_service.files().list.call_args
     query = kwargs.get('q', '')
     assert f"'{folder_id}' in parents" in query
+
+@patch('src.drive_scanner.MediaIoBaseDownload')
+@patch('src.drive_scanner.get_drive_service')
+def test_download_bytes(mock_get_service, mock_downloader_cls):
+    from src.drive_scanner import download_bytes, DOWNLOAD_CHUNK_SIZE
+
+    def fake_downloader(fh, request, chunksize):
+        assert chunksize == DOWNLOAD_CHUNK_SIZE
+        fh.write(b"%PDF-1.4 data")
+        downloader = MagicMock()
+        downloader.next_chunk.return_value = (None, True)
+        return downloader
+
+    mock_downloader_cls.side_effect = fake_downloader
+
+    assert download_bytes("file_1") == b"%PDF-1.4 data"
+    mock_get_service.return_value.files().get_media.assert_called_with(fileId="file_1")
+
+@patch('src.drive_scanner.get_drive_service')
+def test_walk_folder_structure_batches_each_level(mock_get_service):
+    from src import drive_scanner
+    drive_scanner._folder_names.clear()
+
+    # Canned responses per request_id, as delivered by the batch callback
+    responses = {
+        'name:root': {'name': 'Root'},
+        'files:root': {'files': [{'id': 'f1', 'name': 'CO_1.pdf'}]},
+        'subfolders:root': {'files': [{'id': 'sub', 'name': 'Sub'}]},
+        'name:sub': {'name': 'Sub'},
+        'files:sub': {'files': [{'id': 'f2', 'name': 'CQ_2.pdf'}]},
+        'subfolders:sub': {'files': []},
+    }
+    batches = []
+
+    def new_batch(callback):
+        batch = MagicMock()
+        added = []
+        batch.add.side_effect = lambda request, request_id: added.append(request_id)
+        batch.execute.side_effect = lambda: [callback(rid, responses[rid], None) for rid in added]
+        batches.append(added)
+        return batch
+
+    mock_service = MagicMock()
+    mock_service.new_batch_http_request.side_effect = new_batch
+    mock_get_service.return_value = mock_service
+
+    results = list(drive_scanner.walk_folder_structure('root', recursive=True))
+
+    assert results == [('Root', [{'id': 'f1', 'name': 'CO_1.pdf'}]), ('Sub', [{'id': 'f2', 'name': 'CQ_2.pdf'}])]
+    # One round-trip per folder level
+    assert len(batches) == 2
+
+    # A second walk of the same tree doesn't ask for the folder names again
+    batches.clear()
+    assert list(drive_scanner.walk_folder_structure('root', recursive=True)) == results
+    assert not any(rid.startswith('name:') for batch in batches for rid in batch)
+
+@patch('src.drive_scanner.get_drive_service')
+def test_walk_folder_structure_splits_wide_levels(mock_get_service):
+    from src import drive_scanner
+    drive_scanner._folder_names.clear()
+
+    sub_ids = [f"sub{i}" for i in range(60)]
+    batch_sizes = []
+
+    def new_batch(callback):
+        batch = MagicMock()
+        added = []
+        batch.add.side_effect = lambda request, request_id: added.append(request_id)
+
+        def execute():
+            batch_sizes.append(len(added))
+            for rid in added:
+                kind, fid = rid.split(':')
+                if kind == 'subfolders':
+                    children = [{'id': s} for s in sub_ids] if fid == 'root' else []
+                    callback(rid, {'files': children}, None)
+                elif kind == 'name':
+                    callback(rid, {'name': fid}, None)
+                else:
+                    callback(rid, {'files': []}, None)
+        batch.execute.side_effect = execute
+        return batch
+
+    mock_get_service.return_value.new_batch_http_request.side_effect = new_batch
+
+    names = [name for name, _ in drive_scanner.walk_folder_structure('root', recursive=True)]
+
+    assert names == ['root'] + sub_ids
+    # 60 folders x 3 calls = 180 calls, split into batches of at most BATCH_LIMIT
+    assert sorted(batch_sizes) == [3, 80, 100]
+
+def _http_error(status, content=b"{}"):
+    from googleapiclient.errors import HttpError
+    resp = MagicMock()
+    resp.status = status
+    return HttpError(resp, content)
+
+@patch('src.drive_scanner.time.sleep')
+def test_execute_with_backoff_retries_transient_errors(mock_sleep):
+    from src.drive_scanner import _execute_with_backoff
+
+    request = MagicMock()
+    request.execute.side_effect = [_http_error(429), _http_error(503), {'files': []}]
+
+    assert _execute_with_backoff(request) == {'files': []}
+    assert mock_sleep.call_count == 2
+
+@patch('src.drive_scanner.time.sleep')
+def test_execute_with_backoff_raises_permanent_errors(mock_sleep):
+    from googleapiclient.errors import HttpError
+    from src.drive_scanner import _execute_with_backoff
+
+    request = MagicMock()
+    request.execute.side_effect = _http_error(403, b'{"error": {"errors": [{"reason": "insufficientPermissions"}]}}')
+
+    with pytest.raises(HttpError):
+        _execute_with_backoff(request)
+    mock_sleep.assert_not_called()
+
+@patch('src.drive_scanner.get_drive_service')
+def test_get_changes_filters_to_watched_folders(mock_get_service):
+    from src.drive_scanner import get_changes
+
+    mock_get_service.return_value.changes().list().execute.return_value = {
+        'newStartPageToken': 'token_2',
+        'changes': [
+            {'file': {'id': 'new_folder', 'name': 'Batch', 'mimeType': 'application/vnd.google-apps.folder', 'parents': ['root']}},
+            {'file': {'id': 'f1', 'name': 'CO_1.pdf', 'mimeType': 'application/pdf', 'parents': ['new_folder']}},
+            {'file': {'id': 'f2', 'name': 'CQ_2.pdf', 'mimeType': 'application/pdf', 'parents': ['elsewhere']}},
+            {'file': {'id': 'f3', 'name': 'invoice.pdf', 'mimeType': 'application/pdf', 'parents': ['root']}},
+            {'file': {'id': 'f4', 'name': 'CO_4.pdf', 'mimeType': 'application/pdf', 'parents': ['root'], 'trashed': True}},
+            {'removed': True, 'fileId': 'gone'},
+        ],
+    }
+
+    folder_ids = {'root'}
+    files, token = get_changes('token_1', folder_ids, track_subfolders=True)
+
+    assert [f['id'] for f in files] == ['f1']
+    assert token == 'token_2'
+    assert folder_ids == {'root', 'new_folder'}
+
+@patch('src.drive_scanner.get_drive_service')
+def test_search_files_drops_partial_name_matches(mock_get_service):
+    mock_get_service.return_value.files().list().execute.return_value = {
+        'files': [
+            {'id': '1', 'name': 'COCQ-2024.pdf'},
+            {'id': '2', 'name': 'Contract.pdf'},
+            {'id': '3', 'name': 'scan (CQ) 7.pdf'},
+        ]
+    }
+
+    assert [f['id'] for f in search_files()] == ['1', '3']
+
+def test_drive_and_sheets_services_share_one_login():
+    import threading
+    from src import auth, drive_scanner, sheets
+
+    creds = MagicMock(valid=True)
+    with patch.object(auth, '_creds', None), \
+         patch('src.auth.authenticate_google_drive', return_value=creds) as mock_auth, \
+         patch('src.drive_scanner.build') as mock_drive_build, \
+         patch('src.sheets.build') as mock_sheets_build, \
+         patch('src.drive_scanner._local', threading.local()), \
+         patch('src.sheets._local', threading.local()):
+        workers = [threading.Thread(target=fn) for fn in (drive_scanner.get_drive_service, sheets.get_sheets_service) * 4]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+    mock_auth.assert_called_once()
+    assert mock_drive_build.call_count == 4 and mock_sheets_build.call_count == 4
+
+def _fake_batches(responses):
+    """_execute_batch stand-in: canned responses, rejecting repeated request IDs like the Drive batch."""
+    def execute(specs):
+        request_ids = [f"{kind}:{fid}" for kind, fid, _ in specs]
+        assert len(request_ids) == len(set(request_ids)), "duplicate request_id in batch"
+        return {rid: responses[rid] for rid in request_ids if rid in responses}
+    return execute
+
+def test_walk_folders_visits_shared_subfolders_once():
+    from src import drive_scanner
+    drive_scanner._folder_names.clear()
+
+    responses = {'files:shared': {'files': [{'id': 'f1', 'name': 'CO_1.pdf'}]}}
+    for fid, children in {'root': ['a', 'b'], 'a': ['shared'], 'b': ['shared', 'root'], 'shared': []}.items():
+        responses[f'name:{fid}'] = {'name': fid}
+        responses.setdefault(f'files:{fid}', {'files': []})
+        responses[f'subfolders:{fid}'] = {'files': [{'id': c} for c in children]}
+
+    with patch('src.drive_scanner._execute_batch', side_effect=_fake_batches(responses)):
+        walked = [fid for fid, _, _ in drive_scanner.walk_folders('root', recursive=True)]
+
+    assert walked == ['root', 'a', 'b', 'shared']
+
+def test_walk_folders_reports_failed_listings():
+    from src import drive_scanner
+    drive_scanner._folder_names.clear()
+
+    responses = {
+        'name:root': {'name': 'Root'},
+        'files:root': {'files': [{'id': 'f1', 'name': 'CO_1.pdf'}]},
+        'subfolders:root': {'files': [{'id': 'sub'}]},
+        'name:sub': {'name': 'Sub'},
+        # files:sub failed permanently
+        'subfolders:sub': {'files': []},
+    }
+    failed = []
+    with patch('src.drive_scanner._execute_batch', side_effect=_fake_batches(responses)):
+        walked = list(drive_scanner.walk_folders('root', recursive=True, failed=failed))
+
+    assert walked[1] == ('sub', 'Sub', [])
+    assert failed == [('files', 'sub')]
@@ -1,4 +1,5 @@
 import pytest
+import threading
 from unittest.mock import MagicMock, patch
 from src.extractor import extract_date, extract_serial_number, extract_from_tables, extract_data
 
@@ -128,3 +129,129 @@ def test_extract_from_tables_empty():
         
         result = extract_from_tables("dummy_path.pdf")
         assert result == {}
+
+@patch("src.extractor.tesserocr", None)
+@patch("src.extractor.pytesseract.image_to_string", side_effect=lambda image: f"text of {image}")
+@patch("src.extractor.pdf_to_images", return_value=["p1", "p2", "p3"])
+def test_extract_text_with_ocr_keeps_page_order(mock_images, mock_ocr):
+    from src.extractor import extract_text_with_ocr
+
+    text = extract_text_with_ocr("scanned.pdf")
+
+    assert text == (
+        "\n--- Page 1 ---\ntext of p1"
+        "\n--- Page 2 ---\ntext of p2"
+        "\n--- Page 3 ---\ntext of p3"
+    )
+
+@patch("src.extractor._tess_engines", new_callable=list)
+@patch("src.extractor.tesserocr")
+def test_ocr_image_reuses_tesserocr_engine(mock_tesserocr, engines):
+    from src.extractor import ocr_image
+
+    api = mock_tesserocr.PyTessBaseAPI.return_value
+    api.GetUTF8Text.return_value = "page text"
+
+    assert ocr_image("p1") == "page text"
+    # A different thread (e.g. the next document's) gets the same engine back
+    worker = threading.Thread(target=ocr_image, args=("p2",))
+    worker.start()
+    worker.join()
+    mock_tesserocr.PyTessBaseAPI.assert_called_once()
+    api.SetImage.assert_called_with("p2")
+    assert engines == [api]
+
+def test_ocr_cleanup_only_touches_serial_context():
+    from src.extractor import _ocr_cleanup
+
+    text = "Issued 12 05 2023\nSerial No: SN1O23\n2194 907"
+    assert _ocr_cleanup(text) == "Issued 12 05 2023\nSerial No: SN1023\n2194907"
+
+def test_ocr_cleanup_keeps_space_separated_serial_lists():
+    from src.extractor import _ocr_cleanup
+
+    text = "Serial No:\n12345 67890\n22222 33333"
+    assert _ocr_cleanup(text) == text
+    assert extract_serial_number(_ocr_cleanup(text)) == extract_serial_number(text) == ["12345", "67890", "22222", "33333"]
+
+def test_extract_serial_number_dedups_spacing_and_case():
+    assert extract_serial_number("S/N: ABC-123\nSerial No: abc - 123") == ["ABC-123"]
+
+@pytest.mark.parametrize("use_automaton", [True, False])
+def test_keyword_matcher(use_automaton):
+    from src import extractor
+
+    if use_automaton and extractor.ahocorasick is None:
+        pytest.skip("pyahocorasick not installed")
+    with patch.object(extractor, "ahocorasick", extractor.ahocorasick if use_automaton else None):
+        matches = extractor.keyword_matcher(["Ltd", "Street"])
+
+    assert matches("morita mfg ltd")
+    assert matches("12 main street")
+    assert not matches("5087t159")
+
+@pytest.mark.parametrize("result", [
+    ({"date": "01/02/2024", "serial_number": None}, "OCR (Tesseract) (Failed)", True),
+    ({"date": None, "serial_number": None}, "Regex", False),
+    # Partial digital result whose OCR supplement failed: the label stays "Regex"
+    ({"date": "05/01/2024", "serial_number": None}, "Regex", True),
+])
+def test_extract_data_does_not_cache_failures(tmp_path, result):
+    from src import extractor
+
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF-1.4 failing bytes")
+
+    with patch("src.extractor._extract_data_uncached", return_value=result) as mock_extract:
+        extractor.extract_data(str(pdf))
+        extractor.extract_data(str(pdf))
+        assert mock_extract.call_count == 2
+
+def test_extract_data_does_not_cache_partial_result_after_ocr_failure(tmp_path):
+    from src import extractor
+
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF-1.4 date only")
+
+    with patch("src.extractor._digital_pass", return_value=("Date: 05/01/2024", False, {})), \
+            patch("src.extractor.extract_text_with_ocr", return_value="") as mock_ocr:
+        assert extractor.extract_data(str(pdf)) == ({"date": "05/01/2024", "serial_number": None}, "Regex")
+        extractor.extract_data(str(pdf))
+        assert mock_ocr.call_count == 2
+
+def test_extract_data_caches_by_content(tmp_path):
+    import diskcache
+    from src import extractor
+
+    pdf = tmp_path / "doc.pdf"
+    pdf.write_bytes(b"%PDF-1.4 same bytes")
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes(b"%PDF-1.4 same bytes")
+    result = ({"date": "01/02/2024", "serial_number": "SN12345"}, "Regex")
+
+    with patch.object(extractor, "_cache", diskcache.Cache(str(tmp_path / "cache"))), \
+            patch("src.extractor._extract_data_uncached", return_value=result + (False,)) as mock_extract:
+        assert extractor.extract_data(str(pdf)) == result
+        # Same bytes under another name: served from the cache
+        assert extractor.extract_data(str(copy)) == result
+        assert mock_extract.call_count == 1
+        # force_ocr always re-extracts
+        extractor.extract_data(str(copy), force_ocr=True)
+        assert mock_extract.call_count == 2
+
+def test_pdfium_probe_stops_once_text_found():
+    from src import extractor
+
+    def page(text):
+        p = MagicMock()
+        p.get_textpage.return_value.get_text_range.return_value = text
+        p.get_objects.return_value = iter([])
+        return p
+
+    pages = [page("   "), page("Certificate of Origin"), page("never read")]
+    with patch.object(extractor.pdfium, "PdfDocument", return_value=MagicMock(__iter__=lambda _: iter(pages))):
+        text, has_img = extractor._pdfium_probe("doc.pdf")
+
+    assert text == "   \nCertificate of Origin"
+    assert not has_img
+    pages[2].get_textpage.assert_not_called()
@@ -15,19 +15,19 @@ def test_search_filtering_logic():
     
     # 1. Search by serial number (partial match, multi-line)
     query_sn = "SN-002"
-    filtered_sn = df[df["Serial Number"].str.contains(query_sn, case=False, na=False)]
+    filtered_sn = df[df["Serial Number"].str.contains(query_sn, case=False, na=False, regex=False)]
     assert len(filtered_sn) == 1
     assert filtered_sn.iloc[0]["File Name"] == "CO_123.pdf"
     
     # 2. Search by date
     query_date = "12/05/2023"
-    filtered_date = df[df["Date"].str.contains(query_date, case=False, na=False)]
+    filtered_date = df[df["Date"].str.contains(query_date, case=False, na=False, regex=False)]
     assert len(filtered_date) == 2
     
     # 3. Combined search logic check
     filtered_both = df[
-        (df["Serial Number"].str.contains("SN-001", case=False, na=False)) & 
-        (df["Date"].str.contains("12/05/2023", case=False, na=False))
+        (df["Serial Number"].str.contains("SN-001", case=False, na=False, regex=False)) & 
+        (df["Date"].str.contains("12/05/2023", case=False, na=False, regex=False))
     ]
     assert len(filtered_both) == 1
 
@@ -43,11 +43,46 @@ def test_search_filtering_logic():
     
     assert normalized_query == "01/01/2026"
     filtered_norm = df_norm[
-        (df_norm["Date"].str.contains(query_date_raw, case=False, na=False)) |
-        (df_norm["Date"].str.contains(normalized_query, case=False, na=False))
+        (df_norm["Date"].str.contains(query_date_raw, case=False, na=False, regex=False)) |
+        (df_norm["Date"].str.contains(normalized_query, case=False, na=False, regex=False))
     ]
     assert len(filtered_norm) == 1
 
+def test_build_search_index_and_filter_records():
+    from src.search import build_search_index, filter_records
+    df = build_search_index(pd.DataFrame([
+        {"File Name": "CO_1.pdf", "Date": "12/5/2023", "Serial Number": "A5O87~A5O89"},
+        {"File Name": "CQ_2.pdf", "Date": "01/01/2024", "Serial Number": "SN-999\nSN-100"},
+        {"File Name": "CO_3.pdf", "Date": "12/05/2023", "Serial Number": "SN-003"},
+    ]))
+
+    # Range cell with OCR'd O's matches the fuzzy query
+    assert filter_records(df, serial_query="A5088")["File Name"].tolist() == ["CO_1.pdf"]
+    assert filter_records(df, serial_query="SN-100")["File Name"].tolist() == ["CQ_2.pdf"]
+    assert filter_records(df, date_query="12/05/2023")["File Name"].tolist() == ["CO_1.pdf", "CO_3.pdf"]
+    assert filter_records(df, serial_query="SN-003", date_query="1/1/2024").empty
+    # Queries are literal text, not regex patterns
+    assert filter_records(df, date_query="1.*").empty
+    assert filter_records(df, serial_query="SN-(").empty
+
+@pytest.mark.parametrize("use_automaton", [True, False])
+def test_search_serials_batch_matches_filter_records(use_automaton):
+    from src import search
+
+    if use_automaton and search.ahocorasick is None:
+        pytest.skip("pyahocorasick not installed")
+    df = search.build_search_index(pd.DataFrame([
+        {"File Name": "CO_1.pdf", "Date": "12/5/2023", "Serial Number": "A5O87~A5O89"},
+        {"File Name": "CQ_2.pdf", "Date": "01/01/2024", "Serial Number": "SN-999\nSN-100"},
+        {"File Name": "CO_3.pdf", "Date": "12/05/2023", "Serial Number": "SN-003, A5088"},
+    ]))
+    targets = ["A5088", "SN-", "SN-100", "A5O87", "missing"]
+
+    with patch.object(search, "ahocorasick", search.ahocorasick if use_automaton else None):
+        result = search.search_serials_batch(targets, df)
+
+    assert result == {t: search.filter_records(df, serial_query=t).index.tolist() for t in targets}
+
 @patch("src.sheets.get_sheets_service")
 def test_get_sheet_data(mock_get_service):
     # Mock Sheets API response
@@ -70,3 +105,147 @@ def test_get_sheet_data(mock_get_service):
     assert len(result) == 2
     assert result[0]["File Name"] == "file1.pdf"
     assert result[1]["Drive Link"] == "" # Padded check
+
+@patch("src.sheets.get_sheets_service")
+def test_get_sheet_data_reads_app_columns_unformatted(mock_get_service):
+    mock_service = MagicMock()
+    mock_get_service.return_value = mock_service
+    mock_service.spreadsheets().values().get().execute.return_value = {
+        'values': [
+            ["File Name", "Date", "Serial Number", "Drive Link"],
+            ["file1.pdf", "01/01/2023", 2194907, "link1"],
+        ]
+    }
+
+    from src import sheets
+    result = sheets.get_sheet_data("dummy_id")
+
+    assert result[0]["Serial Number"] == "2194907"
+    _, kwargs = mock_service.spreadsheets().values().get.call_args
+    assert kwargs["range"] == sheets.SHEET_RANGE
+    assert kwargs["valueRenderOption"] == "UNFORMATTED_VALUE"
+
+@patch("src.sheets.get_sheets_service")
+def test_get_existing_drive_ids(mock_get_service):
+    mock_get_service.return_value.spreadsheets().values().get().execute.return_value = {
+        'values': [[
+            "Drive Link",
+            "https://drive.google.com/file/d/abc_123-XY/view?usp=drivesdk",
+            "https://drive.google.com/file/d/abc_123-XY/edit",
+            "https://drive.google.com/open?id=def456",
+            "not a drive link",
+            "",
+        ]]
+    }
+
+    from src.sheets import get_existing_drive_ids
+    assert get_existing_drive_ids("dummy_id") == {"abc_123-XY", "def456"}
+
+    # Only the link column is requested
+    _, kwargs = mock_get_service.return_value.spreadsheets().values().get.call_args
+    assert kwargs["range"] == "D:D"
+    assert kwargs["majorDimension"] == "COLUMNS"
+
+@patch("src.sheets.get_sheets_service")
+def test_get_existing_drive_links_falls_back_on_other_layouts(mock_get_service):
+    mock_get_service.return_value.spreadsheets().values().get().execute.side_effect = [
+        {'values': [["Serial Number", "123"]]},
+        {'values': [
+            ["File Name", "Notes", "Serial Number", "Date", "Checked", "Owner", "Drive Link"],
+            ["file1.pdf", "", "123", "01/01/2023", "yes", "me", "link1"],
+            ["file2.pdf", "", "456"],
+            ["file3.pdf", "", "789", "", "", "", ""],
+        ]},
+    ]
+
+    from src import sheets
+    assert sheets.get_existing_drive_links("dummy_id") == {"link1"}
+
+    # The fallback reads past SHEET_RANGE, since the link column is beyond E here
+    _, kwargs = mock_get_service.return_value.spreadsheets().values().get.call_args
+    assert kwargs["range"] == sheets.FULL_SHEET_RANGE
+
+@patch("src.sheets.get_sheets_service")
+def test_clear_sheet_data_counts_rows_with_empty_first_column(mock_get_service):
+    mock_service = MagicMock()
+    mock_get_service.return_value = mock_service
+    mock_service.spreadsheets().values().get().execute.return_value = {
+        'values': [
+            ["File Name", "Date", "Serial Number", "Drive Link", "Content Hash"],
+            ["file1.pdf", "01/01/2023", "123", "link1"],
+            ["", "02/01/2023", "456", "link2"],
+        ]
+    }
+
+    from src import sheets
+    assert sheets.clear_sheet_data("dummy_id") == 2
+
+    _, kwargs = mock_service.spreadsheets().values().get.call_args
+    assert kwargs["range"] == sheets.SHEET_RANGE
+    _, kwargs = mock_service.spreadsheets().values().clear.call_args
+    assert kwargs["range"] == "A2:Z"
+
+def test_column_letter():
+    from src.sheets import column_letter
+    assert column_letter(0) == "A"
+    assert column_letter(25) == "Z"
+    assert column_letter(26) == "AA"
+    assert column_letter(701) == "ZZ"
+    assert column_letter(702) == "AAA"
+
+def test_expand_serial_ranges_drops_overlap_duplicates():
+    from src.utils import expand_serial_ranges
+    assert expand_serial_ranges(["A100~A103, A102~A104", "A100"]) == ["A100", "A101", "A102", "A103", "A104"]
+
+def test_expand_serial_ranges_keeps_multiline_prefix_literal():
+    from src.utils import expand_serial_ranges
+    assert expand_serial_ranges(["AB\nC100~AB\nC103"]) == ["AB\nC100~AB\nC103"]
+
+def test_fuzzy_serials_expand_ranges_once():
+    from src.utils import fuzzy_serial, fuzzy_serials, is_serial_in_range
+    cell = "SN1O01~SN1O03\nX-77"
+    assert fuzzy_serials(cell) == ["SN1001", "SN1002", "SN1003", "X-77"]
+    assert fuzzy_serial("SN1OO2") == "SN1002"
+    assert is_serial_in_range("SN1002", cell)
+    assert not is_serial_in_range("SN1004", cell)
+
+@patch("src.sheets.get_sheets_service")
+def test_get_existing_content_hashes(mock_get_service):
+    mock_service = MagicMock()
+    mock_get_service.return_value = mock_service
+    mock_service.spreadsheets().values().get().execute.return_value = {
+        'values': [["Content Hash", "abc123", "", "def456"]]
+    }
+
+    from src.sheets import get_existing_content_hashes
+    assert get_existing_content_hashes("dummy_id") == {"abc123", "def456"}
+
+    # Older 4-column sheets have no hashes to offer
+    mock_service.spreadsheets().values().get().execute.return_value = {}
+    assert get_existing_content_hashes("dummy_id") == set()
+
+def test_ensure_headers_adds_content_hash_to_old_sheets():
+    from src.sheets import ensure_headers
+    service = MagicMock()
+    service.spreadsheets().values().get().execute.return_value = {
+        'values': [["File Name", "Date", "Serial Number", "Drive Link"]]
+    }
+
+    ensure_headers(service, "dummy_id")
+
+    _, kwargs = service.spreadsheets().values().update.call_args
+    assert kwargs["range"] == "E1"
+    assert kwargs["body"] == {'values': [["Content Hash"]]}
+
+@patch("src.sheets.get_sheets_service")
+def test_append_data_to_sheet_is_raw_and_skips_header_check(mock_get_service):
+    mock_service = MagicMock()
+    mock_get_service.return_value = mock_service
+
+    from src.sheets import append_data_to_sheet
+    append_data_to_sheet("dummy_id", [["file1.pdf", "01/01/2023", "00123", "link1", "abc"]])
+
+    mock_service.spreadsheets().values().get.assert_not_called()
+    _, kwargs = mock_service.spreadsheets().values().append.call_args
+    assert kwargs["valueInputOption"] == "RAW"
+    assert kwargs["insertDataOption"] == "INSERT_ROWS"